@@ -14,18 +14,18 @@ import batchGenerators.variableFontsGenerator
 importlib.reload(batchGenerators.variableFontsGenerator)
 
 import os
+import tempfile
 import AppKit
 import ezui
-import defcon
 
 from mojo.roboFont import OpenFont, AllFonts
 from mojo.extensions import getExtensionDefault, setExtensionDefault, ExtensionBundle
-from lib.tools.misc import walkDirectoryForFile
 
 from batchSettings import BatchSettingsController, defaultSettings
 
 from batchGenerators import desktopFontsGenerator, webFontsGenerator, variableFontsGenerator
-from batchGenerators.batchTools import Report, BatchEditorOperator
+from batchGenerators.batchTools import Report, BatchEditorOperator, CompileCache, removeTree, generateInstanceFonts, probeUFO, scanDirectory, binaryFileTypes, loadSourceBinaries
+from batchGenerators.batchCache import BuildCache, OverlapCache, AutohintCache, SubsetCache, FingerprintCache, QuadraticCache, DirectoryIndex
 
 
 generators = [
@@ -249,24 +249,73 @@ class BatchController(ezui.WindowController):
                 root = path[0]
 
                 progress = self.startProgress("Generating...", parent=self.w)
-                for designspaceDocument in designspaceDocuments:
-                    if shouldGenerateUFOsFromDesignspaces:
-                        designspaceDocument.generateUFOs()
-
                 settings = getExtensionDefault("com.typemytype.batch.settings", defaultSettings)
 
+                # static instances cut from a variable font do not need instance UFOs
+                instancesFromVariableFont = shouldGenerateUFOsFromDesignspaces and settings["batchSettingInstancesFromVariableFont"] and designspaceDocuments
+                if instancesFromVariableFont:
+                    instancePaths = set(instanceDescriptor.path for designspaceDocument in designspaceDocuments for instanceDescriptor in designspaceDocument.instances)
+                    generateOptions["sourceUFOs"] = [path for path in generateOptions["sourceUFOs"] if path not in instancePaths]
+                elif shouldGenerateUFOsFromDesignspaces and settings["batchSettingWriteInstanceUFOs"]:
+                    for designspaceDocument in designspaceDocuments:
+                        designspaceDocument.generateUFOs()
+                elif shouldGenerateUFOsFromDesignspaces and designspaceDocuments:
+                    # generate instances in memory and pass them as font objects
+                    progress.setText("Generate Instances...")
+                    instanceFonts = generateInstanceFonts(
+                        designspaceDocuments,
+                        withSourceHash=bool(settings["batchSettingBuildCache"])
+                    )
+                    generateOptions["sourceUFOs"] = [instanceFonts.get(path, path) for path in generateOptions["sourceUFOs"]]
+                generateOptions["sourceBinaries"] = []
+                binariesRoot = tempfile.mkdtemp(prefix="batchBinaries_")
+                # OTF, OTFWOFF2, TTF, TTFWOFF2 are generated from an otf or ttf binary
+                staticFormats = [key.split("_")[-1].lower() for key, value in generateOptions.items() if value and key.startswith(("desktopFontGenerate_", "webFontGenerate_"))]
+                binaryExtentions = sorted(set(staticFormat[:3] for staticFormat in staticFormats))
+                # share compiled binaries between the generators
+                generateOptions["compileCache"] = CompileCache()
+                # reuse binaries from previous runs
+                generateOptions["buildCache"] = None
+                generateOptions["overlapCache"] = None
+                generateOptions["autohintCache"] = None
+                generateOptions["subsetCache"] = None
+                generateOptions["fingerprintCache"] = None
+                generateOptions["quadraticCache"] = None
+                if settings["batchSettingBuildCache"]:
+                    generateOptions["buildCache"] = BuildCache(settings)
+                    generateOptions["overlapCache"] = OverlapCache(settings)
+                    generateOptions["autohintCache"] = AutohintCache(settings)
+                    generateOptions["subsetCache"] = SubsetCache(settings)
+                    generateOptions["fingerprintCache"] = FingerprintCache(settings)
+                    generateOptions["quadraticCache"] = QuadraticCache(settings)
+
                 try:
                     self.report = Report()
                     self.report.writeTitle("Batch Generate:")
                     self.report.indent()
+                    if instancesFromVariableFont:
+                        generateOptions["sourceBinaries"] = variableFontsGenerator.buildStaticInstances(binariesRoot, generateOptions, settings, progress, self.report, binaryExtentions)
+                    self.routeSourceBinaries(generateOptions, binaryExtentions, binariesRoot, settings)
                     for generator in generators:
                         generator.build(root, generateOptions, settings, progress, self.report)
 
                 finally:
+                    if generateOptions["buildCache"] is not None:
+                        generateOptions["buildCache"].writeSummary(self.report, "Build Cache:")
+                        generateOptions["overlapCache"].writeSummary(self.report, "Remove Overlap Cache:")
+                        generateOptions["overlapCache"].close()
+                        generateOptions["autohintCache"].writeSummary(self.report, "Autohint Cache:")
+                        generateOptions["subsetCache"].writeSummary(self.report, "Subset Cache:")
+                        generateOptions["fingerprintCache"].writeSummary(self.report, "Glyph Fingerprint Cache:")
+                        generateOptions["fingerprintCache"].close()
+                        generateOptions["quadraticCache"].writeSummary(self.report, "Quadratic Curves Cache:")
+                        generateOptions["quadraticCache"].close()
                     self.report.dedent()
                     if settings["batchSettingStoreReport"]:
                         self.report.save(os.path.join(root, "Batch Generate Report.txt"))
                     self.report = None
+                    generateOptions["compileCache"].clear()
+                    removeTree(binariesRoot)
                     progress.close()
 
         self.showGetFolder(
@@ -288,14 +337,20 @@ class BatchController(ezui.WindowController):
         def extractPath(path):
             ext = os.path.splitext(path)[1].lower()
             if ext == ".ufo":
-                dummyFont = defcon.Font(path)
-                if dummyFont.info.familyName is not None and dummyFont.info.styleName is not None:
+                # only read the font info, not the glyphs
+                info = probeUFO(path)
+                if info["formatVersion"] is None:
+                    if self.report is not None:
+                        self.report.write(f"'{path}' is not a valid UFO")
+                elif info["familyName"] is not None and info["styleName"] is not None:
                     ufoPaths.append(path)
                 elif self.report is not None:
                     self.report.write(f"'{path}' has no family name or style name")
             elif os.path.isdir(path):
+                # a single walk for all file types
+                foundPaths = scanDirectory(path, self.supportedFileTypes, directoryIndex=directoryIndex)
                 for ext in self.supportedFileTypes:
-                    for subpath in walkDirectoryForFile(path, ext=ext):
+                    for subpath in foundPaths[ext]:
                         extractPath(subpath)
             elif flattenDesignSpace and ext == ".designspace":
                 if "designspaceDocument" not in item:
@@ -310,11 +365,36 @@ class BatchController(ezui.WindowController):
             elif ext.strip(".") in self.supportedFileTypes:
                 ufoPaths.append(path)
 
-        for item in items:
-            extractPath(item["source"])
+        # reuse the content of unchanged directories from previous runs
+        directoryIndex = None
+        settings = getExtensionDefault("com.typemytype.batch.settings", defaultSettings)
+        if settings["batchSettingBuildCache"]:
+            directoryIndex = DirectoryIndex()
+        try:
+            for item in items:
+                extractPath(item["source"])
+        finally:
+            if directoryIndex is not None:
+                directoryIndex.close()
 
         return ufoPaths, designspaceDocuments
 
+    def routeSourceBinaries(self, generateOptions, binaryExtentions, root, settings):
+        """
+        Move binary and ttx sources with outlines matching all binary extensions
+        from the source UFOs to the source binaries, they are post processed without compiling.
+        Other binary sources are compiled as before.
+        """
+        binaryPaths = [path for path in generateOptions["sourceUFOs"] if isinstance(path, str) and os.path.splitext(path)[1][1:].lower() in binaryFileTypes]
+        if not binaryPaths or not binaryExtentions:
+            return
+        directPaths = set()
+        for path, sourceBinary in zip(binaryPaths, loadSourceBinaries(binaryPaths, root)):
+            if sourceBinary is not None and all(binaryExtention in sourceBinary["paths"] for binaryExtention in binaryExtentions):
+                generateOptions["sourceBinaries"].append(sourceBinary)
+                directPaths.add(path)
+        generateOptions["sourceUFOs"] = [path for path in generateOptions["sourceUFOs"] if not (isinstance(path, str) and path in directPaths)]
+
     def getAllDesignspacePaths(self):
         table = self.w.getItem("sources")
         items = table.getSelectedItems()
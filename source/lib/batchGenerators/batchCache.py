@@ -0,0 +1,600 @@
+import os
+import re
+import importlib
+import json
+import shutil
+import time
+import sqlite3
+import threading
+import hashlib
+import tempfile
+
+import booleanOperations
+
+from fontTools import version as fontToolsVersion
+from fontTools.ttLib import TTFont
+
+from mojo.roboFont import version as roboFontVersion
+from mojo.extensions import ExtensionBundle
+from lib.tools.compileTools import CurrentFDK, CurrentFontCompilerTool
+
+
+cacheRoot = os.path.join(os.path.expanduser("~"), "Library", "Caches", "com.typemytype.batch")
+
+# settings only changing how Batch works, not the generated binaries
+buildCacheIgnoreSettings = [
+    "batchSettingAutohintCacheSize",
+    "batchSettingBuildCache",
+    "batchSettingBuildCacheSize",
+    "batchSettingExportDebug",
+    "batchSettingExportInSubFolders",
+    "batchSettingExportKeepFileNames",
+    "batchSettingFontsInFlight",
+    "batchSettingMaxWorkers",
+    "batchSettingParallel",
+    "batchSettingStoreReport",
+    "batchSettingWriteInstanceUFOs",
+    "desktopFontsSuffix",
+    "variableFontsSuffix",
+    "webFontsSuffix",
+]
+
+ufoIgnoreFileNames = {".DS_Store"}
+
+# in memory fonts can carry a hash of the sources they are generated from
+sourceHashLibKey = "com.typemytype.batch.sourceHash"
+
+featureIncludeRe = re.compile(r"include\s*\(\s*([^)]+?)\s*\)")
+
+
+# ========
+# = hash =
+# ========
+
+def hashData(*items):
+    """
+    Return a hex digest for any json serializable data.
+    """
+    data = json.dumps(items, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def hashFile(path, hashObject=None):
+    if hashObject is None:
+        hashObject = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hashObject.update(chunk)
+    return hashObject.hexdigest()
+
+
+def hashUFO(path):
+    """
+    Return a hex digest of the content of a UFO package:
+    glif files, fontinfo, features (with included files), groups, kerning, lib, data and images.
+    """
+    hashObject = hashlib.sha1()
+    for root, dirNames, fileNames in os.walk(path):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+            if fileName in ufoIgnoreFileNames:
+                continue
+            filePath = os.path.join(root, fileName)
+            hashObject.update(os.path.relpath(filePath, path).encode("utf-8"))
+            hashFile(filePath, hashObject)
+    # feature files can include files outside the UFO package
+    hashFeatureIncludes(os.path.join(path, "features.fea"), path, hashObject)
+    return hashObject.hexdigest()
+
+
+def hashFeatureIncludes(featuresPath, ufoPath, hashObject, visited=None):
+    """
+    Add all files included by a feature file to the hash, also nested includes.
+    Includes are looked up next to the including file, in the UFO and next to the UFO.
+    """
+    if visited is None:
+        visited = set()
+    if not os.path.isfile(featuresPath):
+        return
+    with open(featuresPath, "r", encoding="utf-8", errors="ignore") as f:
+        features = f.read()
+    for include in featureIncludeRe.findall(features):
+        for includeRoot in (os.path.dirname(featuresPath), ufoPath, os.path.dirname(ufoPath)):
+            includePath = os.path.abspath(os.path.join(includeRoot, include))
+            if os.path.isfile(includePath):
+                hashObject.update(include.encode("utf-8"))
+                if includePath not in visited:
+                    visited.add(includePath)
+                    hashFile(includePath, hashObject)
+                    hashFeatureIncludes(includePath, ufoPath, hashObject, visited)
+                break
+
+
+def getToolVersions():
+    """
+    Return the versions of all tools changing the generated binaries:
+    RoboFont, this extension, the python font libraries, the FDK and the font compiler.
+    """
+    versions = dict(roboFont=roboFontVersion, fontTools=fontToolsVersion)
+    for moduleName in ("fontCompiler", "ufo2fdk", "ufoProcessor", "booleanOperations", "defcon", "fontParts", "fontMath"):
+        try:
+            module = importlib.import_module(moduleName)
+        except ImportError:
+            continue
+        versions[moduleName] = getattr(module, "__version__", None)
+    try:
+        versions["batch"] = ExtensionBundle("Batch").version
+    except Exception:
+        versions["batch"] = None
+    # the FDK and the font compiler are external tools, use their path and modification time
+    for name, getTool in (("fdk", CurrentFDK), ("fontCompilerTool", CurrentFontCompilerTool)):
+        try:
+            tool = getTool()
+        except Exception:
+            tool = None
+        modificationTime = None
+        if isinstance(tool, str) and os.path.exists(tool):
+            modificationTime = os.stat(tool).st_mtime_ns
+        versions[name] = str(tool), modificationTime
+    return versions
+
+
+def hashSource(source):
+    """
+    Return a hex digest of a source path, a UFO or a binary.
+    Font objects have no stable content on disk and return None,
+    unless they carry a source hash in their lib.
+    """
+    if not isinstance(source, str):
+        lib = getattr(source, "lib", None)
+        if lib is None:
+            return None
+        return lib.get(sourceHashLibKey)
+    if not os.path.exists(source):
+        return None
+    if os.path.isdir(source):
+        return hashUFO(source)
+    return hashFile(source)
+
+
+# =========
+# = cache =
+# =========
+
+# all caches below share the build cache size, binaries take the largest share
+buildCacheShares = dict(
+    build=0.6,
+    subset=0.2,
+    overlap=0.1,
+    fingerprint=0.05,
+    quadratic=0.05,
+)
+
+
+def getBuildCacheSize(settings, name):
+    """
+    Return the maximum size in bytes of a cache, its share of the build cache size.
+    """
+    return int(settings.get("batchSettingBuildCacheSize", 1024) * 1024 * 1024 * buildCacheShares[name])
+
+
+class BaseCache:
+
+    def __init__(self, name, maxSize):
+        self.name = name
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cacheRoot, exist_ok=True)
+
+    def writeSummary(self, report, title):
+        report.writeTitle(title, "'")
+        report.indent()
+        report.write(f"hits: {self.hits}")
+        report.write(f"misses: {self.misses}")
+        report.dedent()
+        report.newLine()
+
+
+class DiskCache(BaseCache):
+
+    """
+    A persistent file cache on disk.
+    Each entry is a file with an optional json info file, stored by key.
+    The least recently used entries are removed when the cache grows beyond `maxSize` bytes.
+    """
+
+    infoExtension = ".json"
+
+    def __init__(self, name, maxSize):
+        super().__init__(name, maxSize)
+        self.root = os.path.join(cacheRoot, name)
+        os.makedirs(self.root, exist_ok=True)
+        # a running total of the cache size, the cache folder is only listed when it is too big
+        self._size = None
+        self._sizeLock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def _infoPath(self, key):
+        return os.path.join(self.root, f"{key}{self.infoExtension}")
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def __contains__(self, key):
+        return key is not None and os.path.exists(self._path(key))
+
+    def getPath(self, key):
+        """
+        Return the path of the cached file or None when the key is not in the cache.
+        """
+        path = self._path(key)
+        if key is None or not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(path)
+        return path
+
+    def get(self, key, destinationPath):
+        """
+        Copy the cached file to `destinationPath` and return the stored info.
+        Return None when the key is not in the cache.
+        """
+        path = self._path(key)
+        if key is None or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            shutil.copyfile(path, destinationPath)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(path)
+        return self.getInfo(key) or dict()
+
+    def getData(self, key):
+        """
+        Return the cached binary data or None when the key is not in the cache.
+        """
+        path = self.getPath(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            # removed while reading
+            return None
+
+    def setData(self, key, data, info=None):
+        """
+        Store binary data with an optional json info.
+        """
+        if key is None:
+            return
+        fd, tempPath = tempfile.mkstemp(dir=self.root, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        previousSize = self._getSize(key)
+        os.replace(tempPath, self._path(key))
+        if info is not None:
+            self.setInfo(key, info)
+        self._addSize(len(data) - previousSize)
+
+    def set(self, key, sourcePath, info=None):
+        """
+        Store a copy of the file at `sourcePath` with an optional json info.
+        """
+        if key is None or not os.path.exists(sourcePath):
+            return
+        # write to a temp file first so readers never see a half written entry
+        fd, tempPath = tempfile.mkstemp(dir=self.root, prefix=".tmp")
+        os.close(fd)
+        shutil.copyfile(sourcePath, tempPath)
+        size = os.stat(tempPath).st_size
+        previousSize = self._getSize(key)
+        os.replace(tempPath, self._path(key))
+        if info is not None:
+            self.setInfo(key, info)
+        self._addSize(size - previousSize)
+
+    def _getSize(self, key):
+        try:
+            return os.stat(self._path(key)).st_size
+        except OSError:
+            return 0
+
+    def _addSize(self, size):
+        with self._sizeLock:
+            if self._size is None:
+                # list the cache folder once, the new entry is already included
+                self._size = self._listEntries()[1]
+            else:
+                self._size += size
+            shouldEvict = self._size > self.maxSize
+        if shouldEvict:
+            self.evict()
+
+    def getInfo(self, key):
+        infoPath = self._infoPath(key)
+        if not os.path.exists(infoPath):
+            return None
+        try:
+            with open(infoPath, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def setInfo(self, key, info):
+        fd, tempPath = tempfile.mkstemp(dir=self.root, prefix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tempPath, self._infoPath(key))
+
+    def _listEntries(self):
+        """
+        Return a dict with the size and the last used time of each entry and the total size.
+        """
+        entries = dict()
+        for fileName in os.listdir(self.root):
+            if fileName.startswith("."):
+                # entries being written
+                continue
+            path = os.path.join(self.root, fileName)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = fileName
+            if key.endswith(self.infoExtension):
+                key = key[:-len(self.infoExtension)]
+            size, lastUsed = entries.get(key, (0, 0))
+            entries[key] = size + stat.st_size, max(lastUsed, stat.st_mtime)
+        return entries, sum(size for size, _ in entries.values())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `maxSize`.
+        """
+        with self._sizeLock:
+            entries, totalSize = self._listEntries()
+            if totalSize > self.maxSize:
+                for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                    for path in (self._path(key), self._infoPath(key)):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            # already removed
+                            pass
+                    totalSize -= size
+                    if totalSize <= self.maxSize:
+                        break
+            self._size = totalSize
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        self._size = 0
+
+
+class DataCache(BaseCache):
+
+    """
+    A persistent cache for json compatible data, stored by key in a sqlite database.
+    The least recently used entries are removed when the cache grows beyond `maxSize` bytes.
+    The cache can be shared between threads.
+    """
+
+    def __init__(self, name, maxSize):
+        super().__init__(name, maxSize)
+        self.path = os.path.join(cacheRoot, f"{name}.sqlite")
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, data TEXT, size INTEGER, lastUsed REAL)")
+        self._db.commit()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM cache WHERE key = ?", (key, )).fetchone() is not None
+
+    def get(self, key):
+        return self.getMany([key]).get(key)
+
+    def getMany(self, keys):
+        """
+        Return a dict with the cached data for all given keys found in the cache.
+        """
+        keys = list(set(keys))
+        result = dict()
+        with self._lock:
+            # stay below the sqlite variable limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                query = f"SELECT key, data FROM cache WHERE key IN ({', '.join('?' * len(chunk))})"
+                for key, data in self._db.execute(query, chunk):
+                    result[key] = json.loads(data)
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+            if result:
+                now = time.time()
+                self._db.executemany("UPDATE cache SET lastUsed = ? WHERE key = ?", [(now, key) for key in result])
+                self._db.commit()
+        return result
+
+    def set(self, key, data):
+        self.setMany({key: data})
+
+    def setMany(self, items):
+        now = time.time()
+        rows = []
+        for key, data in items.items():
+            data = json.dumps(data)
+            rows.append((key, data, len(data), now))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO cache (key, data, size, lastUsed) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `maxSize`.
+        """
+        with self._lock:
+            totalSize = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if totalSize <= self.maxSize:
+                return
+            removeKeys = []
+            for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY lastUsed"):
+                removeKeys.append((key, ))
+                totalSize -= size
+                if totalSize <= self.maxSize:
+                    break
+            self._db.executemany("DELETE FROM cache WHERE key = ?", removeKeys)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class BuildCache(DiskCache):
+
+    """
+    Binaries from previous Batch runs,
+    stored by a hash of the source content, the compile options and all settings changing the output.
+    """
+
+    def __init__(self, settings):
+        super().__init__("build", maxSize=getBuildCacheSize(settings, "build"))
+        outputSettings = {key: value for key, value in settings.items() if key not in buildCacheIgnoreSettings}
+        self.settingsKey = hashData(outputSettings, getToolVersions())
+
+    def makeKey(self, sourceHash, *options):
+        if sourceHash is None:
+            return None
+        return hashData(self.settingsKey, sourceHash, options)
+
+
+class AutohintCache(DiskCache):
+
+    """
+    Autohinted binaries from previous Batch runs,
+    stored by a hash of the unhinted tables read by the autohinters and the autohint options.
+    Only the tables changed by autohinting are restored from a cached binary.
+    """
+
+    keyTables = ("cmap", "maxp", "hmtx", "GSUB", "glyf", "loca", "CFF ", "CFF2")
+    hintedTables = ("glyf", "maxp", "fpgm", "prep", "cvt ", "gasp", "CFF ", "CFF2")
+
+    def __init__(self, settings):
+        super().__init__("autohint", maxSize=settings.get("batchSettingAutohintCacheSize", 256) * 1024 * 1024)
+
+    def makeKey(self, font, options):
+        hashObject = hashlib.sha1()
+        hashObject.update(hashData(roboFontVersion, options, font.getGlyphOrder(), font["head"].unitsPerEm).encode("utf-8"))
+        for tag in self.keyTables:
+            if tag in font:
+                hashObject.update(tag.encode("ascii"))
+                hashObject.update(font.getTableData(tag))
+        return hashObject.hexdigest()
+
+    def restore(self, key, font):
+        """
+        Copy the cached autohinted tables into `font`.
+        Return False when the key is not in the cache.
+        """
+        path = self.getPath(key)
+        if path is None:
+            return False
+        try:
+            hintedFont = TTFont(path, lazy=False)
+        except Exception:
+            # removed or damaged while reading
+            return False
+        for tag in self.hintedTables:
+            if tag in hintedFont:
+                font[tag] = hintedFont[tag]
+        hintedFont.close()
+        return True
+
+
+class SubsetCache(DiskCache):
+
+    """
+    Subsetted web fonts from previous Batch runs,
+    stored by a hash of the binary and the subset profile.
+    """
+
+    def __init__(self, settings):
+        super().__init__("subset", maxSize=getBuildCacheSize(settings, "subset"))
+
+    def makeKey(self, data, profile):
+        return hashData(fontToolsVersion, profile, hashlib.sha1(data).hexdigest())
+
+
+class OverlapCache(DataCache):
+
+    """
+    Overlap removed glyph outlines from previous Batch runs,
+    stored by a hash of the flattened outline.
+    """
+
+    def __init__(self, settings):
+        super().__init__("overlap", maxSize=getBuildCacheSize(settings, "overlap"))
+
+    def makeKey(self, outline):
+        return hashData(booleanOperations.__version__, outline)
+
+
+class FingerprintCache(DataCache):
+
+    """
+    Structural glyph fingerprints from previous Batch runs,
+    stored by the source path, the glyph name and the modification time of the glif file.
+    """
+
+    def __init__(self, settings):
+        super().__init__("fingerprint", maxSize=getBuildCacheSize(settings, "fingerprint"))
+
+    def makeKey(self, path, glyphName, modificationTime):
+        return hashData(os.path.abspath(path), glyphName, modificationTime)
+
+
+class QuadraticCache(DataCache):
+
+    """
+    Quadratic glyph outlines of all masters from previous Batch runs,
+    stored by a hash of the cubic outlines of all masters and the error tolerance.
+    """
+
+    def __init__(self, settings):
+        super().__init__("quadratic", maxSize=getBuildCacheSize(settings, "quadratic"))
+
+    def makeKey(self, outlines, maxErrors):
+        return hashData(fontToolsVersion, outlines, maxErrors)
+
+
+class DirectoryIndex(DataCache):
+
+    """
+    The file and folder names of scanned directories,
+    stored by directory path and reused while the modification time of the directory did not change.
+    """
+
+    def __init__(self):
+        super().__init__("directories", maxSize=32 * 1024 * 1024)
+
+    def makeKey(self, path):
+        return os.path.abspath(path)
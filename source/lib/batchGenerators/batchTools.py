@@ -1,15 +1,30 @@
+import io
 import os
+import plistlib
 import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from fontTools.ttLib import TTFont
+from fontTools.pens.recordingPen import RecordingPointPen
+from fontTools.pens.pointPen import SegmentToPointPen
+from fontTools.cu2qu.ufo import glyphs_to_quadratic, CURVE_TYPE_LIB_KEY, DEFAULT_MAX_ERR
+from fontTools.cu2qu.errors import IncompatibleGlyphsError, IncompatibleFontsError
 from ufoProcessor import ufoOperator
 
 from lib.settings import shouldAddPointsInSplineConversionLibKey
 
 from mojo.roboFont import RFont, internalFontClasses
 
+from batchGenerators.batchCache import hashSource, hashData, sourceHashLibKey
+
 
 settingsIdentifier = "com.typemytype.batch"
 
+# the path an in memory instance font would be written to
+instancePathLibKey = f"{settingsIdentifier}.instancePath"
+
 
 class BatchEditorOperator(ufoOperator.UFOOperator):
 
@@ -17,6 +32,19 @@ class BatchEditorOperator(ufoOperator.UFOOperator):
         return internalFontClasses.createFontObject(path)
 
 
+def reloadOperatorFonts(operator):
+    """
+    Load all sources of a designspace operator again from disk.
+    Operators are kept between runs: `loadFonts` skips sources already loaded
+    and memoized mutators keep interpolating the sources of an earlier run.
+    """
+    operator.changed()
+    operator.fonts.clear()
+    operator.loadFonts(reload=True)
+    # loadFonts collects the glyph names before loading
+    operator.glyphNames = list({glyphName for font in operator.fonts.values() if font is not None for glyphName in font.keys()})
+
+
 def loadFonts(sourceUFOs):
     fonts = []
     for sourceUFO in sourceUFOs:
@@ -36,6 +64,156 @@ def loadFonts(sourceUFOs):
     return fonts
 
 
+ufoProbeCache = dict()
+ufoProbeCacheLock = threading.Lock()
+
+
+def probeUFO(path):
+    """
+    Return the `familyName`, `styleName` and `formatVersion` of a UFO
+    by reading only fontinfo.plist and metainfo.plist.
+    Missing values are None, results are cached by the modification time of both files.
+    """
+    fileNames = ("metainfo.plist", "fontinfo.plist")
+    modificationTimes = []
+    for fileName in fileNames:
+        try:
+            modificationTimes.append(os.stat(os.path.join(path, fileName)).st_mtime_ns)
+        except OSError:
+            modificationTimes.append(None)
+    key = os.path.abspath(path)
+    with ufoProbeCacheLock:
+        cached = ufoProbeCache.get(key)
+    if cached is not None and cached[0] == modificationTimes:
+        return cached[1]
+    data = dict()
+    for fileName, modificationTime in zip(fileNames, modificationTimes):
+        if modificationTime is None:
+            continue
+        try:
+            with open(os.path.join(path, fileName), "rb") as f:
+                data[fileName] = plistlib.load(f)
+        except Exception:
+            # unreadable plists are reported as missing values
+            pass
+    metaInfo = data.get("metainfo.plist") or dict()
+    fontInfo = data.get("fontinfo.plist") or dict()
+    info = dict(
+        familyName=fontInfo.get("familyName"),
+        styleName=fontInfo.get("styleName"),
+        formatVersion=metaInfo.get("formatVersion"),
+    )
+    with ufoProbeCacheLock:
+        ufoProbeCache[key] = modificationTimes, info
+    return info
+
+
+def scanDirectory(root, extensions, directoryIndex=None):
+    """
+    Find all files and packages with one of the given extensions in a single walk of a directory.
+    Folders with one of the extensions, like UFO packages, are not entered.
+    Symbolic links to folders are not followed, except links to packages.
+    With a directory index only directories with a changed modification time are listed again.
+    Return a dict with a sorted list of paths for each extension.
+    """
+    found = {ext: [] for ext in extensions}
+    directories = [root]
+    while directories:
+        # one level at a time, the directory index is queried once per level
+        modificationTimes = dict()
+        for directory in directories:
+            try:
+                modificationTimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+        cachedEntries = dict()
+        if directoryIndex is not None:
+            cachedEntries = directoryIndex.getMany([directoryIndex.makeKey(directory) for directory in modificationTimes])
+        updatedEntries = dict()
+        nextDirectories = []
+        for directory, modificationTime in modificationTimes.items():
+            key = None
+            if directoryIndex is not None:
+                key = directoryIndex.makeKey(directory)
+            entry = cachedEntries.get(key)
+            if entry is None or entry["modificationTime"] != modificationTime:
+                fileNames = []
+                dirNames = []
+                try:
+                    with os.scandir(directory) as entries:
+                        for dirEntry in entries:
+                            if dirEntry.name.startswith("."):
+                                continue
+                            if dirEntry.is_dir(follow_symlinks=False):
+                                dirNames.append(dirEntry.name)
+                            elif dirEntry.is_symlink() and dirEntry.is_dir():
+                                # a linked package is found, a linked folder could loop forever
+                                if os.path.splitext(dirEntry.name)[1][1:].lower() in found:
+                                    dirNames.append(dirEntry.name)
+                            else:
+                                fileNames.append(dirEntry.name)
+                except OSError:
+                    continue
+                entry = dict(modificationTime=modificationTime, fileNames=sorted(fileNames), dirNames=sorted(dirNames))
+                if key is not None:
+                    updatedEntries[key] = entry
+            for fileName in entry["fileNames"]:
+                ext = os.path.splitext(fileName)[1][1:].lower()
+                if ext in found:
+                    found[ext].append(os.path.join(directory, fileName))
+            for dirName in entry["dirNames"]:
+                ext = os.path.splitext(dirName)[1][1:].lower()
+                if ext in found:
+                    # a package, do not look inside
+                    found[ext].append(os.path.join(directory, dirName))
+                else:
+                    nextDirectories.append(os.path.join(directory, dirName))
+        if updatedEntries:
+            directoryIndex.setMany(updatedEntries)
+        directories = nextDirectories
+    return {ext: sorted(paths) for ext, paths in found.items()}
+
+
+def generateInstanceFonts(operators, withSourceHash=False):
+    """
+    Generate the instances of all designspace operators in memory, one after another.
+    Return a dict with the instance path and the instance font object.
+
+    With `withSourceHash` each font carries a hash of the designspace and all sources,
+    so in memory instances can be restored from the build cache.
+    """
+    jobs = []
+    for operator in operators:
+        # operators are kept between runs, fonts from an earlier run can be outdated
+        reloadOperatorFonts(operator)
+        sourcesHash = None
+        if withSourceHash:
+            sourceHashes = [hashSource(operator.path)] + [hashSource(sourceDescriptor.path) for sourceDescriptor in operator.sources]
+            if None not in sourceHashes:
+                sourcesHash = hashData(sourceHashes)
+        for index, instanceDescriptor in enumerate(operator.instances):
+            if instanceDescriptor.path is None:
+                continue
+            jobs.append((operator, index, instanceDescriptor, sourcesHash))
+
+    instanceFonts = dict()
+    for operator, index, instanceDescriptor, sourcesHash in jobs:
+        # font objects are not thread safe and interpolating is pure python, no workers
+        font = operator.makeInstance(
+            instanceDescriptor,
+            glyphNames=operator.glyphNames,
+            decomposeComponents=False,
+            pairs=None,
+            bend=False,
+        )
+        font = RFont(font, showInterface=False)
+        font.lib[instancePathLibKey] = instanceDescriptor.path
+        if sourcesHash is not None:
+            font.lib[sourceHashLibKey] = hashData(sourcesHash, index, instanceDescriptor.name)
+        instanceFonts[instanceDescriptor.path] = font
+    return instanceFonts
+
+
 def updateWithDefaultValues(data, defaults):
     for key, value in defaults.items():
         if key in data:
@@ -99,6 +277,13 @@ class Report:
         for item in listObject:
             self.write(str(item))
 
+    def writeReport(self, report):
+        for line in report._data:
+            if line:
+                self.write(line)
+            else:
+                self.newLine()
+
     def save(self, path):
         with open(path, "w", encoding="utf-8") as f:
             f.write(self.get())
@@ -162,17 +347,217 @@ def removeTree(path):
         shutil.rmtree(path)
 
 
+# the umask can only be read by setting it, read it once before any worker thread writes files
+umask = os.umask(0)
+os.umask(umask)
+
+
+def writeAtomic(path, data):
+    """
+    Write `data`, bytes or a file object, to `path` without leaving a half written file.
+    """
+    fd, tempPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".batch_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+        # mkstemp creates a private file, use the permissions of a normal write
+        os.chmod(tempPath, 0o666 & ~umask)
+        os.replace(tempPath, path)
+    except Exception:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+
+class BinaryInfo:
+
+    """
+    A generated binary passed through all post process callbacks.
+    The binary is kept in memory between the callbacks, parsed once and only when a fact is requested.
+    The final binary is written once to the destination.
+    Callbacks can add extra files, written together with the final binary.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._isModified = False
+        self._font = None
+        self._facts = dict()
+        self._tempDir = None
+        self.files = []
+        self.report = Report()
+
+    def getData(self):
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self._data
+
+    def setData(self, data, keepFacts=True):
+        """
+        Set new binary data.
+        Facts are kept unless `keepFacts` is False, most post processing does not change the glyph set or the names.
+        """
+        self.closeFont()
+        self._data = data
+        self._isModified = True
+        if not keepFacts:
+            self._facts.clear()
+
+    def getPath(self):
+        """
+        Return the path of a file with the current binary, for tools only working with files.
+        """
+        if self._isModified:
+            if self._tempDir is None:
+                self._tempDir = tempfile.mkdtemp(prefix="batchBinary_")
+            self.path = os.path.join(self._tempDir, f"binary_{id(self._data)}")
+            with open(self.path, "wb") as f:
+                f.write(self._data)
+            self._isModified = False
+        return self.path
+
+    def setPath(self, path):
+        """
+        A tool wrote a new binary to `path`.
+        """
+        self.closeFont()
+        self.path = path
+        self._data = None
+        self._isModified = False
+
+    def addFile(self, path, data, **info):
+        """
+        Add an extra file with binary `data`, written to `path` when the binary is saved.
+        Any additional `info` is kept for later callbacks.
+        """
+        self.files.append(dict(info, path=path, data=data))
+
+    def getFont(self):
+        if self._font is None:
+            self._font = TTFont(io.BytesIO(self.getData()), lazy=True)
+        return self._font
+
+    def _getFact(self, name, func):
+        if name not in self._facts:
+            self._facts[name] = func(self.getFont())
+        return self._facts[name]
+
+    @property
+    def isTTF(self):
+        return self._getFact("isTTF", lambda font: "glyf" in font)
+
+    @property
+    def glyphOrder(self):
+        return self._getFact("glyphOrder", lambda font: font.getGlyphOrder())
+
+    @property
+    def familyName(self):
+        return self._getFact("familyName", lambda font: font["name"].getBestFamilyName())
+
+    @property
+    def styleName(self):
+        return self._getFact("styleName", lambda font: font["name"].getBestSubFamilyName())
+
+    def save(self, destinationPath):
+        """
+        Write the binary to `destinationPath` and all extra files, each in a single atomic write.
+        """
+        if self._data is not None:
+            writeAtomic(destinationPath, self._data)
+        else:
+            with open(self.path, "rb") as source:
+                writeAtomic(destinationPath, source)
+        for item in self.files:
+            writeAtomic(item["path"], item["data"])
+
+    def closeFont(self):
+        if self._font is not None:
+            self._font.close()
+            self._font = None
+
+    def close(self):
+        self.closeFont()
+        self.files = []
+        if self._tempDir is not None:
+            shutil.rmtree(self._tempDir, ignore_errors=True)
+            self._tempDir = None
+
+
 class postProcessCollector:
 
+    """
+    Run post process callbacks on a generated binary.
+    Each callback is called with `sourcePath`, `destinationPath` and a shared `binaryInfo`,
+    and can return a new (sourcePath, destinationPath) to change the destination.
+    Callbacks write report output into `binaryInfo.report`.
+    The binary at `sourcePath` is removed and the result is written once to the destination.
+
+    Callbacks with a `runsInWorker` attribute set to True are safe to run in a worker thread:
+    `prepare` runs all leading worker callbacks, `finish` runs the others in the main thread.
+    """
+
     def __init__(self, *callbacks):
         self.callbacks = [callback for callback in callbacks if callback is not None]
 
-    def __call__(self, sourcePath, destinationPath):
-        for callback in self.callbacks:
-            newSourceDestinationPath = callback(sourcePath, destinationPath)
+    def __call__(self, sourcePath, destinationPath, report=None):
+        state = self.prepare(sourcePath, destinationPath)
+        if state is None:
+            return sourcePath, destinationPath
+        return self.finish(state, report)
+
+    def prepare(self, sourcePath, destinationPath):
+        """
+        Run all leading callbacks able to run in a worker thread.
+        Return a state to pass to `finish` or None when there is no binary.
+        """
+        if not os.path.exists(sourcePath):
+            # nothing generated
+            return None
+        state = dict(
+            binaryInfo=BinaryInfo(sourcePath),
+            compiledPath=sourcePath,
+            sourcePath=sourcePath,
+            destinationPath=destinationPath,
+            callbackIndex=0
+        )
+        try:
+            self._runCallbacks(state, workerOnly=True)
+        except Exception:
+            state["binaryInfo"].close()
+            raise
+        return state
+
+    def finish(self, state, report=None):
+        """
+        Run all remaining callbacks and write the final binary.
+        """
+        if state is None:
+            return None
+        binaryInfo = state["binaryInfo"]
+        try:
+            self._runCallbacks(state)
+            binaryInfo.save(state["destinationPath"])
+        finally:
+            if report is not None:
+                report.writeReport(binaryInfo.report)
+            binaryInfo.close()
+        os.remove(state["compiledPath"])
+        return state["destinationPath"], state["destinationPath"]
+
+    def _runCallbacks(self, state, workerOnly=False):
+        while state["callbackIndex"] < len(self.callbacks):
+            callback = self.callbacks[state["callbackIndex"]]
+            if workerOnly and not getattr(callback, "runsInWorker", False):
+                break
+            newSourceDestinationPath = callback(state["sourcePath"], state["destinationPath"], binaryInfo=state["binaryInfo"])
             if newSourceDestinationPath:
-                sourcePath, destinationPath = newSourceDestinationPath
-        return sourcePath, destinationPath
+                state["sourcePath"], state["destinationPath"] = newSourceDestinationPath
+            state["callbackIndex"] += 1
 
     def __del__(self):
         self.callbacks = None
@@ -181,6 +566,230 @@ class postProcessCollector:
         return bool(self.callbacks)
 
 
+class CompileCache:
+
+    """
+    Compiled binaries of a single Batch run.
+    Generators asking for the same source with the same compile options
+    reuse the binary and only run their own post processing.
+    """
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="batchCompileCache_")
+        self._items = dict()
+        self._lock = threading.Lock()
+
+    def makeKey(self, source, binaryExtention, decompose, removeOverlap, autohint, releaseMode):
+        if isinstance(source, str):
+            source = os.path.abspath(source)
+        else:
+            source = id(source)
+        return (source, binaryExtention, bool(decompose), bool(removeOverlap), bool(autohint), bool(releaseMode))
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def store(self, key, path, result):
+        with self._lock:
+            if key in self._items or not os.path.exists(path):
+                return
+            _, ext = os.path.splitext(path)
+            cachePath = os.path.join(self.root, f"{len(self._items)}{ext}")
+            shutil.copyfile(path, cachePath)
+            self._items[key] = cachePath, result
+
+    def restore(self, key, path):
+        # always copy, post process callbacks are allowed to change the binary in place
+        cachePath, result = self._items[key]
+        shutil.copyfile(cachePath, path)
+        return result
+
+    def clear(self):
+        removeTree(self.root)
+        self._items.clear()
+
+
+# ============
+# = outlines =
+# ============
+
+def recordingToOutline(recording):
+    """
+    Convert a recording point pen value to a json compatible list of point pen calls.
+    """
+    outline = []
+    for operator, args, kwargs in recording:
+        args = list(args)
+        if operator == "addPoint":
+            args[0] = list(args[0])
+        # identifiers are not needed here
+        kwargs = {key: value for key, value in kwargs.items() if key != "identifier"}
+        outline.append([operator, args, kwargs])
+    return outline
+
+
+def getGlyphOutline(glyph):
+    """
+    Return the contours of a glyph as a json compatible list of point pen calls.
+    """
+    pen = RecordingPointPen()
+    # iterating a glyph yields its contours, for fontParts and defcon glyphs
+    for contour in glyph:
+        contour.drawPoints(pen)
+    return recordingToOutline(pen.value)
+
+
+def drawGlyphOutline(outline, pointPen):
+    for operator, args, kwargs in outline:
+        if operator == "addPoint":
+            args = [tuple(args[0])] + list(args[1:])
+        getattr(pointPen, operator)(*args, **kwargs)
+
+
+def setGlyphOutline(glyph, outline):
+    glyph.clearContours()
+    drawGlyphOutline(outline, glyph.getPointPen())
+
+
+def removeFontOverlap(font, overlapCache=None):
+    """
+    Remove overlap in all glyphs of a font.
+    Glyphs with an outline in the `overlapCache` skip the boolean operation.
+    """
+    if overlapCache is None:
+        font.removeOverlap()
+        return
+    glyphOutlines = dict()
+    for glyph in font:
+        if glyph.contours:
+            glyphOutlines[glyph.name] = getGlyphOutline(glyph)
+    keys = {glyphName: overlapCache.makeKey(outline) for glyphName, outline in glyphOutlines.items()}
+    cached = overlapCache.getMany(keys.values())
+    newItems = dict()
+    for glyphName, outline in glyphOutlines.items():
+        key = keys[glyphName]
+        glyph = font[glyphName]
+        if key in cached:
+            # only write back changed glyphs
+            if cached[key] != outline:
+                setGlyphOutline(glyph, cached[key])
+            continue
+        glyph.removeOverlap()
+        newItems[key] = getGlyphOutline(glyph)
+    if newItems:
+        overlapCache.setMany(newItems)
+
+
+class OutlineGlyph:
+
+    """
+    A glyph with only an outline, for glyph based tools running outside the main thread.
+    """
+
+    def __init__(self, name, outline):
+        self.name = name
+        self.outline = outline
+        self._recordingPen = None
+
+    def __len__(self):
+        return len([item for item in self.getOutline() if item[0] == "beginPath"])
+
+    def drawPoints(self, pointPen):
+        drawGlyphOutline(self.getOutline(), pointPen)
+
+    def clearContours(self):
+        self.outline = []
+        self._recordingPen = RecordingPointPen()
+
+    def getPen(self):
+        return SegmentToPointPen(self._recordingPen)
+
+    def getOutline(self):
+        if self._recordingPen is not None:
+            self.outline = recordingToOutline(self._recordingPen.value)
+            self._recordingPen = None
+        return self.outline
+
+
+def convertFontsToQuadratic(fonts, quadraticCache=None):
+    """
+    Convert the cubic curves of compatible fonts to quadratic curves, like cu2qu `fonts_to_quadratic`.
+    All masters of a glyph are converted together,
+    glyphs with cubic outlines in the `quadraticCache` skip the conversion.
+    Return the set of converted glyph names.
+    """
+    curveTypes = {font.lib.get(CURVE_TYPE_LIB_KEY, "cubic") for font in fonts}
+    if len(curveTypes) == 1 and curveTypes.pop() in ("quadratic", "mixed"):
+        # already converted
+        return set()
+    maxErrors = [(font.info.unitsPerEm or 1000) * DEFAULT_MAX_ERR for font in fonts]
+    glyphNames = sorted(set().union(*(font.keys() for font in fonts)))
+
+    convertedGlyphNames = set()
+    glyphErrors = dict()
+    if quadraticCache is None:
+        # convert the glyphs directly, without an outline copy
+        for glyphName in glyphNames:
+            fontIndexes = [fontIndex for fontIndex, font in enumerate(fonts) if glyphName in font]
+            glyphs = [fonts[fontIndex][glyphName] for fontIndex in fontIndexes]
+            try:
+                if glyphs_to_quadratic(glyphs, max_err=[maxErrors[fontIndex] for fontIndex in fontIndexes], all_quadratic=True):
+                    convertedGlyphNames.add(glyphName)
+            except IncompatibleGlyphsError as error:
+                glyphErrors[glyphName] = error
+    else:
+        jobs = dict()
+        for glyphName in glyphNames:
+            fontIndexes = [fontIndex for fontIndex, font in enumerate(fonts) if glyphName in font]
+            outlines = [getGlyphOutline(fonts[fontIndex][glyphName]) for fontIndex in fontIndexes]
+            if any(outlines):
+                jobs[glyphName] = fontIndexes, outlines
+
+        keys = {glyphName: quadraticCache.makeKey(outlines, [maxErrors[fontIndex] for fontIndex in fontIndexes]) for glyphName, (fontIndexes, outlines) in jobs.items()}
+        cached = quadraticCache.getMany(keys.values())
+        results = dict()
+        newItems = dict()
+        for glyphName, (fontIndexes, outlines) in jobs.items():
+            key = keys[glyphName]
+            if key in cached:
+                results[glyphName] = cached[key]
+                continue
+            glyphs = [OutlineGlyph(glyphName, outline) for outline in outlines]
+            try:
+                isModified = glyphs_to_quadratic(glyphs, max_err=[maxErrors[fontIndex] for fontIndex in fontIndexes], all_quadratic=True)
+            except IncompatibleGlyphsError as error:
+                glyphErrors[glyphName] = error
+                continue
+            # None for glyphs without curves
+            results[glyphName] = newItems[key] = [glyph.getOutline() for glyph in glyphs] if isModified else None
+        if newItems:
+            quadraticCache.setMany(newItems)
+
+        # only write back converted glyphs
+        for glyphName, outlines in results.items():
+            if outlines is None:
+                continue
+            fontIndexes, _ = jobs[glyphName]
+            for fontIndex, outline in zip(fontIndexes, outlines):
+                setGlyphOutline(fonts[fontIndex][glyphName], outline)
+            convertedGlyphNames.add(glyphName)
+    if glyphErrors:
+        raise IncompatibleFontsError(glyphErrors)
+    for font in fonts:
+        font.lib[CURVE_TYPE_LIB_KEY] = "quadratic"
+    return convertedGlyphNames
+
+
+def getMaxWorkers(settings):
+    """
+    Return the amount of jobs allowed to run at the same time.
+    """
+    if not settings.get("batchSettingParallel"):
+        return 1
+    maxWorkers = settings.get("batchSettingMaxWorkers") or os.cpu_count() or 1
+    return max(1, maxWorkers)
+
+
 def generatePaths(
         sourceUFOs,
         binaryFormats,
@@ -193,113 +802,441 @@ def generatePaths(
         exportInFolders,
         root,
         report,
-        progress
+        progress,
+        maxWorkers=1,
+        compileCache=None,
+        buildCache=None,
+        overlapCache=None,
+        fontsInFlight=0
     ):
-    fonts = loadFonts(sourceUFOs)
+    """
+    Generate all sources in all binary formats.
 
-    if decompose:
-        report.writeTitle("Decompose:")
-        report.indent()
-        progress.setText("Decompose...")
-        progress.setMaxValue(len(fonts))
-        for font in fonts:
-            report.write(f"{font.info.familyName} {font.info.styleName}")
-            progress.increment()
-            font.decompose()
-        progress.setMaxValue(None)
-        report.dedent()
-        report.newLine()
-        decompose = False
+    With `fontsInFlight` set to 0 all sources are loaded and processed before compiling.
+    Otherwise each source is loaded, processed, compiled, post processed and closed
+    with at most `fontsInFlight` fonts in memory at the same time.
 
-    if removeOverlap:
-        report.writeTitle("Remove Overlap:")
-        report.indent()
-        progress.setText("Remove Overlap...")
-        progress.setMaxValue(len(fonts))
-        for font in fonts:
-            report.write(f"{font.info.familyName} {font.info.styleName}")
-            progress.increment()
-            font.removeOverlap()
-        progress.setMaxValue(None)
-        report.dedent()
-        report.newLine()
-        removeOverlap = False
-
-    report.writeTitle("Generate:")
-    progress.setText("Generate...")
-    progress.setMaxValue(len(fonts))
-    report.indent()
-
-    for index, font in enumerate(fonts):
-        fontPath = font.path
-        progress.increment()
-        report.writeTitle((os.path.basename(fontPath)))
-        report.indent()
-        report.newLine()
-        report.write(f"source: {fontPath}")
-        report.newLine()
-        for binaryFormat, postProcessCallback in binaryFormats:
-            binaryExtention = binaryFormat.split("-")[0]
-            report.writeTitle(f"Generate {binaryFormat}")
-            report.indent()
-            familyName = font.info.familyName or f"familyName-{index}"
-            familyName = familyName.replace(" ", "")
-            styleName = font.info.styleName or f"styleName-{index}"
-            styleName = styleName.replace(" ", "")
-            if keepFileNames and fontPath is not None:
-                fileName = os.path.basename(fontPath)
-                fileName, _ = os.path.splitext(fileName)
-                fileName = f"{fileName}{suffix}.{binaryExtention}"
-            else:
-                fileName = f"{familyName}-{styleName}{suffix}.{binaryExtention}"
+    Binaries are compiled one after another in the main thread: font objects and the compiler
+    are not thread safe and font objects can not be passed to other processes.
+    Only the post processing of each binary (build cache, autohint, woff2) runs in `maxWorkers` workers.
+    """
+    # compile into a private temp folder, only final binaries are written into the root
+    tempRoot = tempfile.mkdtemp(prefix="batchGenerate_")
+    try:
+        def getCacheKeys(sourceUFO):
+            # collect the compile and build cache keys for each format
+            # before decompose and remove overlap are applied
+            sourceHash = None
+            if buildCache is not None:
+                sourceHash = hashSource(sourceUFO)
+            keys = []
+            for binaryFormat, _ in binaryFormats:
+                compileOptions = (binaryFormat.split("-")[0], decompose, removeOverlap, autohint, releaseMode)
+                compileKey = buildKey = None
+                if compileCache is not None:
+                    compileKey = compileCache.makeKey(sourceUFO, *compileOptions)
+                if buildCache is not None:
+                    buildKey = buildCache.makeKey(sourceHash, *compileOptions)
+                keys.append((compileKey, buildKey))
+            return keys
 
-            tempFileName = f"temp_{index}_{fileName}"
+        def isCached(compileKey, buildKey):
+            if compileKey is not None and compileKey in compileCache:
+                return True
+            return buildKey is not None and buildKey in buildCache
 
-            progress.setText("Generating ... {fileName}")
-            if exportInFolders:
-                fontDir = os.path.join(root, binaryFormat)
-            else:
-                fontDir = root
-            buildTree(fontDir)
-            path = os.path.join(fontDir, tempFileName)
-            report.write(f"path: {path})")
-            result = font.generate(
-                path=path,
-                format=binaryExtention,
-                decompose=decompose,
-                checkOutlines=removeOverlap,
+        def needsProcessing(keys):
+            # only fonts with at least one binary not in a cache must be processed
+            return not all(isCached(*key) for key in keys)
+
+        def makeJobs(index, font, keys, isProcessed):
+            jobs = []
+            for (binaryFormat, postProcessCallback), (compileKey, buildKey) in zip(binaryFormats, keys):
+                binaryExtention = binaryFormat.split("-")[0]
+                familyName = font.info.familyName or f"familyName-{index}"
+                familyName = familyName.replace(" ", "")
+                styleName = font.info.styleName or f"styleName-{index}"
+                styleName = styleName.replace(" ", "")
+                sourcePath = font.path or font.lib.get(instancePathLibKey)
+                if keepFileNames and sourcePath is not None:
+                    fileName = os.path.basename(sourcePath)
+                    fileName, _ = os.path.splitext(fileName)
+                    fileName = f"{fileName}{suffix}.{binaryExtention}"
+                else:
+                    fileName = f"{familyName}-{styleName}{suffix}.{binaryExtention}"
+
+                # formats with the same extension are compiled at the same time
+                tempFileName = f"temp_{index}_{binaryFormat}_{fileName}"
+
+                if exportInFolders:
+                    fontDir = os.path.join(root, binaryFormat)
+                else:
+                    fontDir = root
+                buildTree(fontDir)
+                jobs.append(dict(
+                    font=font,
+                    isProcessed=isProcessed,
+                    binaryFormat=binaryFormat,
+                    binaryExtention=binaryExtention,
+                    postProcessCallback=postProcessCallback,
+                    fileName=fileName,
+                    path=os.path.join(tempRoot, tempFileName),
+                    destinationPath=os.path.join(fontDir, fileName),
+                    compileKey=compileKey,
+                    buildKey=buildKey,
+                    # None, "compile" or "build"
+                    restoredFrom=None,
+                ))
+            return jobs
+
+        def compileJob(job):
+            if job["compileKey"] is not None and job["compileKey"] in compileCache:
+                job["restoredFrom"] = "compile"
+                return compileCache.restore(job["compileKey"], job["path"])
+            if job["buildKey"] is not None:
+                info = buildCache.get(job["buildKey"], job["path"])
+                if info is not None:
+                    job["restoredFrom"] = "build"
+                    return info.get("result", "")
+            font = job["font"]
+            # fonts with all binaries in a cache are not decomposed or overlap removed yet
+            return font.generate(
+                path=job["path"],
+                format=job["binaryExtention"],
+                decompose=decompose and not job["isProcessed"],
+                checkOutlines=removeOverlap and not job["isProcessed"],
                 autohint=autohint,
                 releaseMode=releaseMode,
                 progressBar=progress,
                 glyphOrder=font.glyphOrder
             )
-            sourcePath = os.path.join(fontDir, tempFileName)
-            destinationPath = os.path.join(fontDir, fileName)
-            sourcePath, destinationPath = postProcessCallback(
-                sourcePath,
-                destinationPath
-            )
-            if os.path.exists(sourcePath) and sourcePath != destinationPath:
-                shutil.copyfile(sourcePath, destinationPath)
-                os.remove(sourcePath)
 
+        def storeJob(job, result):
+            # store in the main thread right after compiling,
+            # the next job of the same font with the same compile key reuses the binary
+            if job["restoredFrom"] is None and job["compileKey"] is not None:
+                compileCache.store(job["compileKey"], job["path"], result)
+
+        def prepareJob(job, result):
+            # store before post processing changes or removes the compiled binary
+            if job["restoredFrom"] is None and job["buildKey"] is not None:
+                buildCache.set(job["buildKey"], job["path"], dict(result=result))
+            # run the post process callbacks safe to run in a worker (autohint, woff2)
+            return result, job["postProcessCallback"].prepare(job["path"], job["destinationPath"])
+
+        def writeJobs(font, jobs, preparedJobs, fontReport=None):
+            # finish post processing and report a single font, in the main thread
+            fontPath = font.path or font.lib.get(instancePathLibKey) or f"{font.info.familyName} {font.info.styleName}"
+            progress.increment()
+            report.writeTitle((os.path.basename(fontPath)))
+            report.indent()
+            report.newLine()
+            report.write(f"source: {fontPath}")
+            report.newLine()
+            if fontReport is not None:
+                report.writeReport(fontReport)
+                report.newLine()
+            for job, (result, postProcessState) in zip(jobs, preparedJobs):
+                report.writeTitle(f"Generate {job['binaryFormat']}")
+                report.indent()
+                progress.setText(f"Generating ... {job['fileName']}")
+                report.write(f"path: {job['destinationPath']}")
+                if job["restoredFrom"] == "compile":
+                    report.write("reused binary compiled earlier in this batch")
+                elif job["restoredFrom"] == "build":
+                    report.write("restored binary from the build cache")
+                # post process in memory and write the final binary once
+                job["postProcessCallback"].finish(postProcessState, report)
+
+                report.indent()
+                report.write(result)
+                report.dedent()
+                report.dedent()
+                report.newLine()
+            if not font.hasInterface():
+                font.close()
+            report.dedent()
+
+        def generateFonts(count, getFont):
+            # compile the binaries of a single font one after another in the main thread,
+            # only the post processing of each binary (autohint, woff2) runs in the worker pool
+            # fonts are reported and closed in order once their post processing is done
+            postProcessExecutor = ThreadPoolExecutor(max_workers=maxWorkers) if maxWorkers > 1 else None
+            pending = deque()
+
+            def submit(job, result):
+                if postProcessExecutor is None:
+                    future = Future()
+                    future.set_result(prepareJob(job, result))
+                    return future
+                return postProcessExecutor.submit(prepareJob, job, result)
+
+            def writeFinishedFonts(wait=False, maxPending=0):
+                while pending and (wait or (maxPending and len(pending) >= maxPending) or all(future.done() for future in pending[0][2])):
+                    font, jobs, futures, fontReport = pending.popleft()
+                    writeJobs(font, jobs, [future.result() for future in futures], fontReport)
+
+            try:
+                for index in range(count):
+                    font, jobs, fontReport = getFont(index)
+                    futures = []
+                    for job in jobs:
+                        result = compileJob(job)
+                        storeJob(job, result)
+                        futures.append(submit(job, result))
+                    pending.append((font, jobs, futures, fontReport))
+                    # with fonts in flight wait until a font is closed before loading the next
+                    writeFinishedFonts(maxPending=fontsInFlight)
+                writeFinishedFonts(wait=True)
+            finally:
+                if postProcessExecutor is not None:
+                    postProcessExecutor.shutdown(wait=True)
+
+        if fontsInFlight:
+            def streamSource(index):
+                # load and process a single source
+                sourceUFO = sourceUFOs[index]
+                fontReport = Report()
+                keys = getCacheKeys(sourceUFO)
+                font = loadFonts([sourceUFO])[0]
+                isProcessed = needsProcessing(keys)
+                if isProcessed and decompose:
+                    fontReport.write("Decompose")
+                    font.decompose()
+                if isProcessed and removeOverlap:
+                    fontReport.write("Remove Overlap")
+                    removeFontOverlap(font, overlapCache=overlapCache)
+                return font, makeJobs(index, font, keys, isProcessed), fontReport
+
+            report.writeTitle("Generate:")
+            progress.setText("Generate...")
+            progress.setMaxValue(len(sourceUFOs))
+            report.indent()
+            generateFonts(len(sourceUFOs), streamSource)
+            progress.setMaxValue(None)
+            report.dedent()
+            return
+
+        cacheKeys = [getCacheKeys(sourceUFO) for sourceUFO in sourceUFOs]
+        fonts = loadFonts(sourceUFOs)
+        fontsToProcess = [font for font, keys in zip(fonts, cacheKeys) if needsProcessing(keys)]
+        processedFontIDs = set(id(font) for font in fontsToProcess)
+
+        if decompose and fontsToProcess:
+            report.writeTitle("Decompose:")
             report.indent()
-            report.write(result)
+            progress.setText("Decompose...")
+            progress.setMaxValue(len(fontsToProcess))
+            for font in fontsToProcess:
+                report.write(f"{font.info.familyName} {font.info.styleName}")
+                progress.increment()
+                font.decompose()
+            progress.setMaxValue(None)
             report.dedent()
+            report.newLine()
+
+        if removeOverlap and fontsToProcess:
+            report.writeTitle("Remove Overlap:")
+            report.indent()
+            progress.setText("Remove Overlap...")
+            progress.setMaxValue(len(fontsToProcess))
+            for font in fontsToProcess:
+                report.write(f"{font.info.familyName} {font.info.styleName}")
+                progress.increment()
+                removeFontOverlap(font, overlapCache=overlapCache)
+            progress.setMaxValue(None)
             report.dedent()
             report.newLine()
-        if not font.hasInterface():
-            font.close()
+
+        # collect all (font, format) jobs
+        fontJobs = [makeJobs(index, font, keys, id(font) in processedFontIDs) for index, (font, keys) in enumerate(zip(fonts, cacheKeys))]
+
+        report.writeTitle("Generate:")
+        progress.setText("Generate...")
+        progress.setMaxValue(len(fonts))
+        report.indent()
+        generateFonts(len(fonts), lambda index: (fonts[index], fontJobs[index], None))
+        progress.setMaxValue(None)
+        report.dedent()
+    finally:
+        removeTree(tempRoot)
+
+
+binaryFileTypes = ["otf", "ttf", "woff", "woff2", "ttx"]
+
+
+def loadSourceBinary(path, root, index):
+    """
+    Return a source binary for `generateBinaryPaths` from a binary or ttx file.
+    Flavored binaries and ttx files are converted to an unflavored binary in `root`,
+    unflavored binaries are used as they are.
+    """
+    ext = os.path.splitext(path)[1][1:].lower()
+    if ext == "ttx":
+        font = TTFont()
+        font.importXML(path)
+    else:
+        font = TTFont(path)
+    binaryExtention = "otf" if "CFF " in font or "CFF2" in font else "ttf"
+    binaryPath = path
+    if ext == "ttx" or font.flavor is not None:
+        font.flavor = None
+        binaryPath = os.path.join(root, f"source_{index}.{binaryExtention}")
+        font.save(binaryPath)
+    familyName = font["name"].getBestFamilyName() if "name" in font else None
+    styleName = font["name"].getBestSubFamilyName() if "name" in font else None
+    font.close()
+    return dict(
+        familyName=familyName,
+        styleName=styleName,
+        source=path,
+        fileName=os.path.splitext(os.path.basename(path))[0],
+        paths={binaryExtention: binaryPath}
+    )
+
+
+def loadSourceBinaries(paths, root):
+    """
+    Load all binary and ttx sources, one after another.
+    Return a list of source binaries, None for sources failing to load.
+    """
+    sourceBinaries = []
+    for index, path in enumerate(paths):
+        try:
+            sourceBinaries.append(loadSourceBinary(path, root, index))
+        except Exception:
+            sourceBinaries.append(None)
+    return sourceBinaries
+
+
+def generateBinaryPaths(
+        sourceBinaries,
+        binaryFormats,
+        keepFileNames,
+        suffix,
+        exportInFolders,
+        root,
+        report,
+        progress,
+        decompose=False,
+        removeOverlap=False,
+        autohint=False,
+        releaseMode=False
+    ):
+    """
+    Post process binaries built outside `generatePaths` in all binary formats,
+    for example static instances cut from a variable font or binary sources.
+
+    Each source binary is a dict with a `familyName`, a `styleName`, a `source`,
+    an optional `fileName` and a `paths` dict with a binary path for each binary extension.
+    An optional `appliedSettings` set lists the settings already applied to the binary
+    and an optional `skippedSettings` list describes anything else not applied.
+    Formats without a binary with the same extension are skipped.
+
+    Binaries are not compiled: `decompose`, `removeOverlap`, `autohint` and `releaseMode`
+    are not applied, a warning is reported for each enabled setting.
+    """
+    if not sourceBinaries:
+        return
+    compileSettings = [
+        ("decompose", "Decompose", decompose),
+        ("removeOverlap", "Remove Overlap", removeOverlap),
+        ("autohint", "Autohint", autohint),
+        ("releaseMode", "Release Mode", releaseMode),
+    ]
+    tempRoot = tempfile.mkdtemp(prefix="batchBinaries_")
+    try:
+        def makeJobs(index, sourceBinary):
+            jobs = []
+            familyName = (sourceBinary.get("familyName") or f"familyName-{index}").replace(" ", "")
+            styleName = (sourceBinary.get("styleName") or f"styleName-{index}").replace(" ", "")
+            for binaryFormat, postProcessCallback in binaryFormats:
+                binaryExtention = binaryFormat.split("-")[0]
+                if keepFileNames and sourceBinary.get("fileName"):
+                    fileName = f"{sourceBinary['fileName']}{suffix}.{binaryExtention}"
+                else:
+                    fileName = f"{familyName}-{styleName}{suffix}.{binaryExtention}"
+                if exportInFolders:
+                    fontDir = os.path.join(root, binaryFormat)
+                else:
+                    fontDir = root
+                buildTree(fontDir)
+                jobs.append(dict(
+                    binaryFormat=binaryFormat,
+                    binaryPath=sourceBinary["paths"].get(binaryExtention),
+                    postProcessCallback=postProcessCallback,
+                    fileName=fileName,
+                    path=os.path.join(tempRoot, f"temp_{index}_{binaryFormat}_{fileName}"),
+                    destinationPath=os.path.join(fontDir, fileName),
+                ))
+            return jobs
+
+        def prepareSource(index):
+            # each format post processes its own copy of the binary
+            preparedJobs = []
+            for job in sourceJobs[index]:
+                if job["binaryPath"] is None:
+                    preparedJobs.append(None)
+                    continue
+                shutil.copyfile(job["binaryPath"], job["path"])
+                preparedJobs.append(job["postProcessCallback"].prepare(job["path"], job["destinationPath"]))
+            return preparedJobs
+
+        sourceJobs = [makeJobs(index, sourceBinary) for index, sourceBinary in enumerate(sourceBinaries)]
+
+        report.writeTitle("Generate from Binaries:")
+        progress.setText("Generate...")
+        progress.setMaxValue(len(sourceBinaries))
+        report.indent()
+        for index, (sourceBinary, jobs) in enumerate(zip(sourceBinaries, sourceJobs)):
+            # parsing and post processing binaries is mostly pure python, one source after another
+            preparedJobs = prepareSource(index)
+            progress.increment()
+            report.writeTitle(f"{sourceBinary.get('familyName')} {sourceBinary.get('styleName')}")
+            report.indent()
+            report.newLine()
+            report.write(f"source: {sourceBinary['source']}")
+            report.newLine()
+            appliedSettings = sourceBinary.get("appliedSettings", ())
+            skippedSettings = [title for key, title, value in compileSettings if value and key not in appliedSettings]
+            skippedSettings.extend(sourceBinary.get("skippedSettings", ()))
+            for title in skippedSettings:
+                report.write(f"warning: skipped '{title}'")
+            if skippedSettings:
+                report.newLine()
+            for job, postProcessState in zip(jobs, preparedJobs):
+                report.writeTitle(f"Generate {job['binaryFormat']}")
+                report.indent()
+                if job["binaryPath"] is None:
+                    report.write(f"no '{job['binaryFormat'].split('-')[0]}' binary available")
+                else:
+                    progress.setText(f"Generating ... {job['fileName']}")
+                    report.write(f"path: {job['destinationPath']}")
+                    job["postProcessCallback"].finish(postProcessState, report)
+                report.dedent()
+                report.newLine()
+            report.dedent()
+        progress.setMaxValue(None)
         report.dedent()
-    progress.setMaxValue(None)
-    report.dedent()
+    finally:
+        removeTree(tempRoot)
 
 
-def WOFF2Builder(sourcePath, destinationPath):
+def WOFF2Builder(sourcePath, destinationPath, binaryInfo=None):
     fileName, ext = os.path.splitext(destinationPath)
     destinationPath = fileName + f"_{ext[1:]}" + ".woff2"
-    font = TTFont(sourcePath)
+    if binaryInfo is None:
+        font = TTFont(sourcePath)
+        font.flavor = "woff2"
+        font.save(destinationPath)
+        os.remove(sourcePath)
+        return destinationPath, destinationPath
+    font = binaryInfo.getFont()
     font.flavor = "woff2"
-    font.save(destinationPath)
-    os.remove(sourcePath)
+    data = io.BytesIO()
+    font.save(data)
+    binaryInfo.setData(data.getvalue())
     return destinationPath, destinationPath
+
+
+WOFF2Builder.runsInWorker = True
@@ -1,7 +1,7 @@
 import os
 from mojo.roboFont import RFont
 
-from batchGenerators.batchTools import removeTree, generatePaths, postProcessCollector
+from batchGenerators.batchTools import removeTree, generatePaths, generateBinaryPaths, postProcessCollector, getMaxWorkers
 
 
 def build(root, generateOptions, settings, progress, report):
@@ -36,5 +36,26 @@ def build(root, generateOptions, settings, progress, report):
         exportInFolders=settings["batchSettingExportInSubFolders"],
         root=desktopFontsRoot,
         report=report,
-        progress=progress
+        progress=progress,
+        maxWorkers=getMaxWorkers(settings),
+        compileCache=generateOptions.get("compileCache"),
+        buildCache=generateOptions.get("buildCache"),
+        overlapCache=generateOptions.get("overlapCache"),
+        fontsInFlight=settings["batchSettingFontsInFlight"]
+    )
+
+    # static instances cut from a variable font and binary sources
+    generateBinaryPaths(
+        sourceBinaries=generateOptions.get("sourceBinaries"),
+        binaryFormats=binaryFormats,
+        keepFileNames=settings["batchSettingExportKeepFileNames"],
+        suffix=settings["desktopFontsSuffix"],
+        exportInFolders=settings["batchSettingExportInSubFolders"],
+        root=desktopFontsRoot,
+        report=report,
+        progress=progress,
+        decompose=settings["desktopFontsDecompose"],
+        removeOverlap=settings["desktopFontsRemoveOverlap"],
+        autohint=settings["desktopFontsAutohint"],
+        releaseMode=settings["desktopFontsReleaseMode"]
     )
@@ -1,12 +1,16 @@
+import io
 import os
 import shutil
+import tempfile
+from array import array
 
 import defcon
 
-from fontTools.cu2qu.ufo import fonts_to_quadratic
 from fontTools import varLib
+from fontTools.varLib import instancer
 from fontTools.varLib.stat import buildVFStatTable
 from fontTools.ttLib import TTFont
+from fontTools.pens.recordingPen import RecordingPointPen
 
 from fontPens.transformPointPen import TransformPointPen
 
@@ -16,12 +20,13 @@ from fontCompiler.compiler import generateFont, FontCompilerOptions
 
 from ufo2fdk.kernFeatureWriter import side1Prefix, side2Prefix
 
-from batchGenerators.batchTools import postProcessCollector, WOFF2Builder, buildTree, removeTree, BatchEditorOperator, Report
+from batchGenerators.batchTools import postProcessCollector, WOFF2Builder, buildTree, removeTree, BatchEditorOperator, reloadOperatorFonts, Report, convertFontsToQuadratic
+from batchGenerators.batchCache import hashSource, hashData
 
 
 class GenerateVariableFont:
 
-    def __init__(self, operator, destinationPath, designspace=None, discreteAxisName=None, autohint=False, fitToExtremes=False, releaseMode=True, glyphOrder=None, report=None, debug=False):
+    def __init__(self, operator, destinationPath, designspace=None, discreteAxisName=None, autohint=False, fitToExtremes=False, releaseMode=True, glyphOrder=None, report=None, debug=False, glyphCache=None, fingerprintCache=None, quadraticCache=None):
         # this must be an operator with no discrete axes.
         # split the designspace first first
         if report is None:
@@ -37,48 +42,77 @@ class GenerateVariableFont:
         self.glyphOrder = glyphOrder
         self.report = report
         self.debug = debug
+        # missing glyphs made from the sources, shared between builds of the same sources
+        if glyphCache is None:
+            glyphCache = dict()
+        self.glyphCache = glyphCache
+        self.fingerprintCache = fingerprintCache
+        self.quadraticCache = quadraticCache
+        # sources are reloaded from disk once per build
+        self.sourcesLoaded = False
         self.build()
 
     def build(self):
-        self.generatedFiles = set()
-
-        self.operator.loadFonts(reload=True)
-        self.applySkipExportGlyphs()
-        self.makeSourceGlyphsCompatible()
-        self.decomposedMixedGlyphs()
-        self.makeSourceKerningCompatible()
-        self.makeSourceOnDefaultLocation()
-        self.makeLayerSource()
-        self.makeSourcesAtAxesExtremes()
-        if self.binaryFormat == "ttf":
-            self.makeSourceGlyphsQuadractic()
-        elif self.binaryFormat == "otf":
-            self.makeSourceExportOptimizeCharstring()
-
-        self.generate()
-
-        if not self.debug:
-            # remove generated files
-            for path in self.generatedFiles:
-                if os.path.exists(path):
-                    if os.path.isdir(path):
-                        shutil.rmtree(path)
-                    else:
-                        os.remove(path)
+        # work in a private temp folder, in debug mode next to the variable font
+        if self.debug:
+            self.workRoot = os.path.dirname(self.destinationPath)
+        else:
+            self.workRoot = tempfile.mkdtemp(prefix="batchVariableWork_")
+        try:
+            # always start from the sources on disk, not from fonts left by an earlier run
+            reloadOperatorFonts(self.operator)
+            self.sourcesLoaded = True
+            # glyphs changed in memory, different from the glif files
+            self.changedGlyphNames = set()
+            # index all components once, passes only touch affected glyphs
+            self.componentIndexes = dict()
+            for font in self.operator.fonts.values():
+                self.getComponentIndex(font)
+            self.applySkipExportGlyphs()
+            self.makeSourceGlyphsCompatible()
+            self.decomposedMixedGlyphs()
+            self.makeSourceKerningCompatible()
+            self.makeSourceOnDefaultLocation()
+            self.makeLayerSource()
+            self.makeSourcesAtAxesExtremes()
+            if self.binaryFormat == "ttf":
+                self.makeSourceGlyphsQuadractic()
+            elif self.binaryFormat == "otf":
+                self.makeSourceExportOptimizeCharstring()
+
+            self.generate()
+        finally:
+            if not self.debug:
+                # remove generated files, also when the build fails
+                removeTree(self.workRoot)
+
+    def getComponentIndex(self, font):
+        componentIndex = self.componentIndexes.get(id(font))
+        if componentIndex is None:
+            componentIndex = self.componentIndexes[id(font)] = ComponentIndex(font)
+        return componentIndex
 
     def applySkipExportGlyphs(self):
         for font in self.operator.fonts.values():
             skipExportGlyphs = set(font.lib.get("public.skipExportGlyphs", []))
             if skipExportGlyphs:
+                componentIndex = self.getComponentIndex(font)
                 # Decompose the listed glyphs everywhere they are used as components.
-                for glyph in font:
+                for glyphName in componentIndex.getUsers(skipExportGlyphs):
+                    if glyphName in skipExportGlyphs:
+                        # removed anyhow
+                        continue
+                    glyph = font[glyphName]
                     for component in glyph.components:
                         if component.baseGlyph in skipExportGlyphs:
                             glyph.decomposeComponent(component)
+                    componentIndex.updateGlyph(glyph)
+                    self.changedGlyphNames.add(glyphName)
                 # Remove these glyphs before the compilation run.
                 for glyphName in skipExportGlyphs:
                     if glyphName in font:
                         del font[glyphName]
+                        componentIndex.removeGlyph(glyphName)
                 # Prune all groups of the listed glyphs.
                 for key, value in list(font.groups.items()):
                     font.groups[key] = [glyphName for glyphName in value if glyphName not in skipExportGlyphs]
@@ -138,52 +172,66 @@ class GenerateVariableFont:
             glyphNames.update(font.keys())
         # get the default source
         defaultSource = self.operator.findDefaultFont()
+        # collect all missing glyphs for each source in a single pass
+        missingGlyphs = dict()
+        for sourceDescriptor in self.operator.sources:
+            sourceFont = self.operator.fonts[sourceDescriptor.name]
+            if sourceFont is defaultSource:
+                continue
+            for glyphName in glyphNames.difference(sourceFont.keys()):
+                missingGlyphs.setdefault(glyphName, []).append(sourceDescriptor)
+        # glyphs with the same structure in all sources are already compatible
+        compatibleGlyphNames = self.getCompatibleGlyphNames([glyphName for glyphName in glyphNames if glyphName in defaultSource and glyphName not in missingGlyphs])
+        repairedGlyphCount = 0
         # loop over all glyphName
         for glyphName in glyphNames:
-            # first check if the default source has this glyph
-            if glyphName not in defaultSource:
-                # the default does not have the glyph
-                # build a repair glyph
-                result = self.operator.makeOneGlyph(
-                    glyphName=glyphName,
-                    location=self.operator.newDefaultLocation(),
-                    decomposeComponents=False,
-                    useVarlib=False,
-                    roundGeometry=self.operator.roundGeometry,
-                    clip=False
-                )
-                self.report.write(f"Adding missing glyph '{glyphName}' in the default source '{defaultSource.info.familyName} {defaultSource.info.styleName}'")
-                # add the glyph to the default source
-                glyph = defaultSource.newGlyph(glyphName)
-                result.extractGlyph(glyph, onlyGeometry=True)
-                glyph.unicodes = list(result.unicodes)
-
-            sourceGlyphs = []
-            # fill all sources with missing glyphs
-            # and collect all glyphs from all sources
+            if glyphName in compatibleGlyphNames:
+                continue
+            missingDefault = glyphName not in defaultSource
+            missingSources = missingGlyphs.get(glyphName, [])
+            isRepaired = bool(missingDefault or missingSources)
+            if missingDefault or missingSources:
+                if missingDefault:
+                    # only the missing default glyph falls back to mutatorMath
+                    result, = self.makeMissingGlyphs(glyphName, [self.operator.newDefaultLocation()], useVarlib=False)
+                    if result is None:
+                        self.report.write(f"Could not add missing glyph '{glyphName}' in the default source '{defaultSource.info.familyName} {defaultSource.info.styleName}'")
+                    else:
+                        self.report.write(f"Adding missing glyph '{glyphName}' in the default source '{defaultSource.info.familyName} {defaultSource.info.styleName}'")
+                        # add the glyph to the default source
+                        glyph = defaultSource.newGlyph(glyphName)
+                        result.extractGlyph(glyph, onlyGeometry=True)
+                        glyph.unicodes = list(result.unicodes)
+                        self.getComponentIndex(defaultSource).updateGlyph(glyph)
+                # build the missing glyphs of all other sources from a single mutator, with the model of the operator
+                results = self.makeMissingGlyphs(glyphName, [sourceDescriptor.location for sourceDescriptor in missingSources], useVarlib=self.operator.useVarlib)
+                # fill all sources with missing glyphs
+                for sourceDescriptor, result in zip(missingSources, results):
+                    sourceFont = self.operator.fonts[sourceDescriptor.name]
+                    if result is None:
+                        self.report.write(f"Could not add missing glyph '{glyphName}' in the source '{sourceFont.info.familyName} {sourceFont.info.styleName}'")
+                        continue
+                    self.report.write(f"Adding missing glyph '{glyphName}' in the source '{sourceFont.info.familyName} {sourceFont.info.styleName}'")
+                    # add the glyph to the source
+                    glyph = sourceFont.newGlyph(glyphName)
+                    result.extractGlyph(glyph, onlyGeometry=True)
+                    glyph.unicodes = list(result.unicodes)
+                    self.getComponentIndex(sourceFont).updateGlyph(glyph)
+
+            # collect all glyphs from all sources
             # to send them to optimize contour data
+            sourceGlyphs = []
             for sourceDescriptor in self.operator.sources:
                 sourceFont = self.operator.fonts[sourceDescriptor.name]
                 if glyphName in sourceFont:
                     sourceGlyphs.append(sourceFont[glyphName])
-                    continue
-                # build a filler glyph
-                result = self.operator.makeOneGlyph(
-                    glyphName=glyphName,
-                    location=sourceDescriptor.location,
-                    decomposeComponents=False,
-                    useVarlib=self.operator.useVarlib,
-                    roundGeometry=self.operator.roundGeometry,
-                    clip=False
-                )
-                self.report.write(f"Adding missing glyph '{glyphName}' in the source '{sourceFont.info.familyName} {sourceFont.info.styleName}'")
-                # add the glyph to the source
-                glyph = sourceFont.newGlyph(glyphName)
-                result.extractGlyph(glyph, onlyGeometry=True)
-                glyph.unicodes = list(result.unicodes)
-                sourceGlyphs.append(glyph)
             # optimize glyph contour data from all source
-            self.makeGlyphOutlinesCompatible(sourceGlyphs)
+            if self.makeGlyphOutlinesCompatible(sourceGlyphs):
+                isRepaired = True
+            if isRepaired:
+                repairedGlyphCount += 1
+
+        self.report.write(f"{repairedGlyphCount} of {len(glyphNames)} glyphs needed repair, {len(compatibleGlyphNames)} glyphs skipped with matching fingerprints")
 
         if self.debug:
             for name, font in self.operator.fonts.items():
@@ -200,40 +248,147 @@ class GenerateVariableFont:
         self.report.dedent()
         self.report.newLine()
 
+    def getCompatibleGlyphNames(self, glyphNames):
+        """
+        Return the names of all given glyphs with the same structural fingerprint in all sources.
+        Fingerprints of glyphs unchanged on disk are stored in `fingerprintCache` between runs.
+        """
+        fonts = [self.operator.fonts[sourceDescriptor.name] for sourceDescriptor in self.operator.sources]
+        cacheKeys = dict()
+        if self.fingerprintCache is not None:
+            for fontIndex, font in enumerate(fonts):
+                # only glyphs read from a glif file can be looked up
+                glyphSet = getattr(font.layers.defaultLayer, "_glyphSet", None)
+                if font.path is None or glyphSet is None:
+                    continue
+                for glyphName in glyphNames:
+                    if glyphName in self.changedGlyphNames:
+                        continue
+                    try:
+                        modificationTime = glyphSet.getGLIFModificationTime(glyphName)
+                    except KeyError:
+                        continue
+                    if modificationTime is not None:
+                        cacheKeys[fontIndex, glyphName] = self.fingerprintCache.makeKey(font.path, glyphName, modificationTime)
+        cachedFingerprints = dict()
+        if cacheKeys:
+            cachedFingerprints = self.fingerprintCache.getMany(cacheKeys.values())
+
+        newFingerprints = dict()
+        compatibleGlyphNames = set()
+        for glyphName in glyphNames:
+            fingerprints = set()
+            for fontIndex, font in enumerate(fonts):
+                cacheKey = cacheKeys.get((fontIndex, glyphName))
+                fingerprint = cachedFingerprints.get(cacheKey)
+                if fingerprint is None:
+                    fingerprint = getGlyphFingerprint(font[glyphName])
+                    if cacheKey is not None:
+                        newFingerprints[cacheKey] = fingerprint
+                fingerprints.add(fingerprint)
+                if len(fingerprints) > 1:
+                    break
+            if len(fingerprints) == 1:
+                compatibleGlyphNames.add(glyphName)
+        if newFingerprints:
+            self.fingerprintCache.setMany(newFingerprints)
+        return compatibleGlyphNames
+
+    def makeMissingGlyphs(self, glyphName, locations, useVarlib=False):
+        """
+        Build a single mutator for `glyphName` and return a math glyph, or None, for each location.
+        Results are cached in `glyphCache`, other builds of the same sources reuse them.
+        """
+        keys = [(glyphName, repr(sorted(location.items())), useVarlib) for location in locations]
+        missing = [(key, location) for key, location in zip(keys, locations) if key not in self.glyphCache]
+        if missing:
+            if not self.sourcesLoaded:
+                # reload once, later calls keep the changes made in memory
+                reloadOperatorFonts(self.operator)
+                self.sourcesLoaded = True
+            previousModel = self.operator.useVarlib
+            # memoized mutators are not keyed by the model, drop them when switching
+            switchModel = useVarlib != previousModel
+            if switchModel:
+                self.operator.changed()
+            self.operator.useVarlib = useVarlib
+            try:
+                glyphMutator, unicodes = self.operator.getGlyphMutator(glyphName, decomposeComponents=False, discreteLocation=None)
+            finally:
+                self.operator.useVarlib = previousModel
+                if switchModel:
+                    self.operator.changed()
+
+            for key, location in missing:
+                result = None
+                if glyphMutator is None:
+                    pass
+                elif self.operator.isAnisotropic(location):
+                    # rare, let ufoProcessor handle the horizontal and vertical parts
+                    result = self.operator.makeOneGlyph(
+                        glyphName=glyphName,
+                        location=location,
+                        decomposeComponents=False,
+                        useVarlib=useVarlib,
+                        roundGeometry=self.operator.roundGeometry,
+                        clip=False
+                    )
+                else:
+                    if not self.operator.extrapolate:
+                        location = self.operator.clipDesignLocation(location)
+                    try:
+                        result = glyphMutator.makeInstance(location, bend=False)
+                    except IndexError:
+                        # alignment problem with the data
+                        result = None
+                    if result is not None:
+                        if self.operator.roundGeometry:
+                            result = result.round()
+                        result.unicodes = unicodes
+                self.glyphCache[key] = result
+        return [self.glyphCache[key] for key in keys]
+
     def makeGlyphOutlinesCompatible(self, glyphs):
+        """
+        Add missing off curves so all contours have the same segment types.
+        Return True when a glyph changed.
+        """
+        isChanged = False
         if len(glyphs) <= 1:
-            return
-        # map all segment type for the given glyphs by contour index
-        glyphSegmentTypeMap = {}
-        for glyph in glyphs:
-            for i, contour in enumerate(glyph):
-                types = [point.segmentType for point in contour if point.segmentType]
-                if i not in glyphSegmentTypeMap:
-                    glyphSegmentTypeMap[i] = list()
-                glyphSegmentTypeMap[i].append((types, glyph))
-        for contourIndex, contourTypes in glyphSegmentTypeMap.items():
+            return isChanged
+        # map all segment types for the given glyphs by contour index as compact code arrays
+        glyphSegmentCodes = [[getSegmentTypeCodes(contour) for contour in glyph] for glyph in glyphs]
+        contourCount = max(len(contourCodes) for contourCodes in glyphSegmentCodes)
+        for contourIndex in range(contourCount):
+            contourCodes = [(contourCodes[contourIndex], glyph) for contourCodes, glyph in zip(glyphSegmentCodes, glyphs) if contourIndex < len(contourCodes)]
+            firstCodes = contourCodes[0][0]
+            # most contours are already compatible
+            if all(codes == firstCodes for codes, _ in contourCodes):
+                continue
             # collect all segment types for a single glyph
-            pointTypes = None
-            for types, glyph in contourTypes:
-                if pointTypes is None:
-                    pointTypes = list(types)
-                else:
-                    for i, t in enumerate(types):
-                        if t in ("curve", "qcurve"):
-                            pointTypes[i] = t
-
-            font = glyph.font
+            pointCodes = array("b", firstCodes)
+            for codes, _ in contourCodes[1:]:
+                for i, code in enumerate(codes[:len(pointCodes)]):
+                    if code in curveSegmentTypeCodes:
+                        pointCodes[i] = code
             # check if they are different
-            for types, glyph in contourTypes:
-                if types == pointTypes:
+            for codes, glyph in contourCodes:
+                if codes == pointCodes:
                     continue
                 # add missing off curves
+                font = glyph.font
                 self.report.write(f"Adding missing offcurves in contour {contourIndex} for glyph '{glyph.name}' in source '{font.info.familyName} {font.info.styleName}'")
                 contour = glyph[contourIndex]
-                pen = CompatibleContourPointPen(pointTypes)
-                contour.drawPoints(pen)
+                points = makeCompatiblePoints(contour, pointCodes)
                 contour.clear()
-                pen.drawPoints(contour)
+                contour.beginPath()
+                for x, y, segmentType, smooth, name in points:
+                    # identifiers are not needed here
+                    # but the could cause errors, so remove them
+                    contour.addPoint((x, y), segmentType, smooth=smooth, name=name, identifier=None)
+                contour.endPath()
+                isChanged = True
+        return isChanged
 
     def decomposedMixedGlyphs(self):
         """
@@ -243,23 +398,19 @@ class GenerateVariableFont:
         self.report.indent()
         fontSources = self.operator.fonts.values()
         for fontSource in fontSources:
-            for glyph in fontSource:
+            componentIndex = self.getComponentIndex(fontSource)
+            # only glyphs with components can be mixed
+            for glyphName in componentIndex.getCompositeGlyphNames():
+                glyph = fontSource[glyphName]
                 # check if the glyph has both contour point data as components
                 if len(glyph) and len(glyph.components):
-                    # found, loop over all components and decompose
+                    # found, draw all components fully decomposed into the glyph
+                    decomposePointPen = DecomposePointPen(componentIndex, glyph.getPointPen())
                     for component in glyph.components:
-                        # get the source font
-                        base = fontSource[component.baseGlyph]
-                        # get the decompose pen
-                        decomposePointPen = DecomposePointPen(glyph.layer, glyph.getPointPen(), component.transformation)
-                        # draw the base into the pen
-                        for contour in base:
-                            contour.drawPoints(decomposePointPen)
-                        # draw the base components into the pen
-                        for component in base.components:
-                            component.drawPoints(decomposePointPen)
+                        component.drawPoints(decomposePointPen)
                     # remove all components
                     glyph.clearComponents()
+                    componentIndex.updateGlyph(glyph)
                     self.report.write(f"Decomposing glyph '{glyph.name}' in source '{fontSource.info.familyName} {fontSource.info.styleName}'")
         self.report.dedent()
         self.report.newLine()
@@ -268,8 +419,8 @@ class GenerateVariableFont:
         """
         Optimize and convert all source ufo to quad curves.
         """
-        # use cu2qu to optimize all sources
-        fonts_to_quadratic(self.operator.fonts.values())
+        # use cu2qu to optimize all sources, all masters of a glyph are converted together
+        convertFontsToQuadratic(list(self.operator.fonts.values()), quadraticCache=self.quadraticCache)
 
     def makeSourceExportOptimizeCharstring(self):
         for name, font in self.operator.fonts.items():
@@ -294,35 +445,29 @@ class GenerateVariableFont:
             allGroups.update(sourceFont.groups)
         # build a kerning mutator
         kerningMutator = self.operator.getKerningMutator()
-        kerningCache = dict()
-        # loop over all pairs
-        for pair in allPairs:
-            # loop over all sources
-            for sourceDescriptor in self.operator.sources:
-                sourceFont = self.operator.fonts[sourceDescriptor.name]
-                missingPairs = []
-                missingGroups = []
-                if pair not in sourceFont.kerning:
-                    missingPairs.append(pair)
-                    kerningInstance = kerningCache.get(sourceDescriptor.name)
-                    if kerningInstance is None:
-                        kerningInstance = kerningMutator.makeInstance(sourceDescriptor.location)
-                        kerningCache[sourceDescriptor.name] = kerningInstance
-                    sourceFont.kerning[pair] = kerningInstance[pair]
-                    # check pairs on group kerning
-                    side1, side2 = pair
-                    if side1.startswith(side1Prefix) and side1 not in sourceFont.groups:
-                        # add a group
-                        sourceFont.groups[side1] = allGroups[side1]
-                        missingGroups.append(side1)
-                    if side2.startswith(side2Prefix) and side2 not in sourceFont.groups:
-                        # add a group
-                        sourceFont.groups[side2] = allGroups[side2]
-                        missingGroups.append(side2)
-                if missingPairs:
-                    self.report.write(f"Adding missing kerning pairs in {sourceFont.info.familyName} {sourceFont.info.styleName}: {', '.join(['(%s, %s)' % (s1, s2) for s1, s2 in missingPairs])}")
-                if missingGroups:
-                    self.report.write(f"Adding missing kerning groups in {sourceFont.info.familyName} {sourceFont.info.styleName}: {', '.join(missingGroups)}")
+        # loop over all sources
+        # and fill the missing pairs of each source in bulk
+        for sourceDescriptor in self.operator.sources:
+            sourceFont = self.operator.fonts[sourceDescriptor.name]
+            missingPairs = allPairs.difference(sourceFont.kerning.keys())
+            if not missingPairs:
+                continue
+            # a single kerning instance for all missing pairs of the source
+            kerningInstance = kerningMutator.makeInstance(sourceDescriptor.location)
+            sourceFont.kerning.update({pair: kerningInstance[pair] for pair in missingPairs})
+            # check pairs on group kerning
+            missingGroups = set()
+            for side1, side2 in missingPairs:
+                if side1.startswith(side1Prefix) and side1 not in sourceFont.groups:
+                    missingGroups.add(side1)
+                if side2.startswith(side2Prefix) and side2 not in sourceFont.groups:
+                    missingGroups.add(side2)
+            if missingGroups:
+                # add groups
+                sourceFont.groups.update({groupName: allGroups[groupName] for groupName in missingGroups})
+            self.report.write(f"Adding {len(missingPairs)} missing kerning pairs in {sourceFont.info.familyName} {sourceFont.info.styleName}")
+            if missingGroups:
+                self.report.write(f"Adding {len(missingGroups)} missing kerning groups in {sourceFont.info.familyName} {sourceFont.info.styleName}: {', '.join(sorted(missingGroups))}")
         self.report.dedent()
         self.report.newLine()
 
@@ -360,7 +505,7 @@ class GenerateVariableFont:
 
                 path, ext = os.path.splitext(layeredUFOPath)
 
-                sourceDescriptor.path = os.path.join(os.path.dirname(self.destinationPath), f"{path}-{layerName}{ext}")
+                sourceDescriptor.path = os.path.join(self.workRoot, f"{os.path.basename(path)}-{layerName}{ext}")
                 sourceDescriptor.styleName = f"{sourceDescriptor.styleName} {layerName}"
                 sourceDescriptor.filename = None
                 sourceDescriptor.layerName = None
@@ -370,11 +515,65 @@ class GenerateVariableFont:
                 layeredSource.save(sourceDescriptor.path)
 
                 self.operator.fonts[sourceDescriptor.name] = layeredSource
-                self.generatedFiles.add(sourceDescriptor.path)
 
-    def generate(self, ):
-        dirname = os.path.dirname(self.destinationPath)
+    def generateMaster(self, sourceCount, sourceDescriptor, options):
+        """
+        Compile a single master and return a report.
+        """
+        report = Report()
+        source = self.operator.fonts[sourceDescriptor.name]
+        # get the output path
+        familyName = sourceDescriptor.familyName
+        if not familyName:
+            familyName = source.info.familyName
+        styleName = sourceDescriptor.styleName
+        if not styleName:
+            styleName = source.info.styleName
+        outputPath = os.path.join(self.workRoot, f"temp_{sourceCount}_{familyName}-{styleName}.{self.binaryFormat}")
+        # set the output path
+        options.outputPath = outputPath
+        options.layerName = None
+        if sourceDescriptor.layerName:
+            options.layerName = sourceDescriptor.layerName
+        # generate the font
+        result = ""
+        try:
+            result = generateFont(source, options=options)
+            report.write(result)
+            # hand the master to varLib in memory
+            with open(outputPath, "rb") as f:
+                sourceDescriptor.font = TTFont(io.BytesIO(f.read()))
+            if not self.debug:
+                os.remove(outputPath)
+            if sourceDescriptor.layerName:
+                # https://github.com/googlefonts/ufo2ft/blob/150c2d6a00da9d5854173c8457a553ce03b89cf7/Lib/ufo2ft/_compilers/interpolatableTTFCompiler.py#L58-L66
+                if "post" in sourceDescriptor.font:
+                    sourceDescriptor.font["post"].underlinePosition = -0x8000
+                    sourceDescriptor.font["post"].underlineThickness = -0x8000
+
+            if self.debug:
+                tempSavePath = os.path.join(self.workRoot, f"temp_{sourceCount}_{familyName}-{styleName}.ufo")
+                source.save(tempSavePath)
+                if source.layers.defaultLayer.name != sourceDescriptor.layerName:
+                    tempFont = defcon.Font(tempSavePath)
+                    tempFont.layers.defaultLayer = tempFont.layers[sourceDescriptor.layerName]
+                    tempFont.save()
+        except Exception as e:
+            import traceback
+            tracebackResult = traceback.format_exc()
+            print(tracebackResult)
+            report.newLine()
+            report.write(f"Generate failed {familyName}-{styleName}")
+            report.indent()
+            report.write(tracebackResult)
+            report.dedent()
+
+        report.newLine()
+        report.write(f"Generate {familyName}-{styleName}")
+        report.write(result)
+        return report
 
+    def generate(self, ):
         # fontCompiler settings
         options = FontCompilerOptions()
         options.fdk = CurrentFDK()
@@ -397,63 +596,18 @@ class GenerateVariableFont:
         self.report.writeTitle(f"Generate {self.binaryFormat.upper()}", "'")
         self.report.indent()
 
+        # compile the masters one after another, the compiler is not thread safe
         for sourceCount, sourceDescriptor in enumerate(self.operator.sources):
-            source = self.operator.fonts[sourceDescriptor.name]
-            # get the output path
-            familyName = sourceDescriptor.familyName
-            if not familyName:
-                familyName = source.info.familyName
-            styleName = sourceDescriptor.styleName
-            if not styleName:
-                styleName = source.info.styleName
-            outputPath = os.path.join(dirname, f"temp_{sourceCount}_{familyName}-{styleName}.{self.binaryFormat}")
-            self.generatedFiles.add(outputPath)
-            # set the output path
-            options.outputPath = outputPath
-            options.layerName = None
-            if sourceDescriptor.layerName:
-                options.layerName = sourceDescriptor.layerName
-            # generate the font
-            result = ""
-            try:
-                result = generateFont(source, options=options)
-                self.report.write(result)
-                sourceDescriptor.font = TTFont(outputPath)
-                if sourceDescriptor.layerName:
-                    # https://github.com/googlefonts/ufo2ft/blob/150c2d6a00da9d5854173c8457a553ce03b89cf7/Lib/ufo2ft/_compilers/interpolatableTTFCompiler.py#L58-L66
-                    if "post" in sourceDescriptor.font:
-                        sourceDescriptor.font["post"].underlinePosition = -0x8000
-                        sourceDescriptor.font["post"].underlineThickness = -0x8000
-
-                if self.debug:
-                    tempSavePath = os.path.join(dirname, f"temp_{sourceCount}_{familyName}-{styleName}.ufo")
-                    source.save(tempSavePath)
-                    if source.layers.defaultLayer.name != sourceDescriptor.layerName:
-                        tempFont = defcon.Font(tempSavePath)
-                        tempFont.layers.defaultLayer = tempFont.layers[sourceDescriptor.layerName]
-                        tempFont.save()
-            except Exception as e:
-                import traceback
-                tracebackResult = traceback.format_exc()
-                print(tracebackResult)
-                self.report.newLine()
-                self.report.write(f"Generate failed {familyName}-{styleName}")
-                self.report.indent()
-                self.report.write(tracebackResult)
-                self.report.dedent()
-
-            self.report.newLine()
-            self.report.write(f"Generate {familyName}-{styleName}")
-            self.report.write(result)
+            self.report.writeReport(self.generateMaster(sourceCount, sourceDescriptor, options))
         self.report.dedent()
 
-        # optimize the design space for varlib
-        designSpacePath = os.path.join(dirname, f"{self.destinationPath}.designspace")
-        self.operator.write(designSpacePath)
-        self.generatedFiles.add(designSpacePath)
+        if self.debug:
+            # varLib gets the designspace document in memory
+            designSpacePath = f"{self.destinationPath}.designspace"
+            self.operator.write(designSpacePath)
 
         try:
-            # let varLib build the variation font
+            # let varLib build the variation font with all masters in memory
             varFont, _, _ = varLib.build(self.operator.doc)
             if self.designspace and self.discreteAxisName:
                 # build the stat table from the full designspace and according discrete axis
@@ -484,132 +638,391 @@ def build(root, generateOptions, settings, progress, report):
     variableFontsRoot = os.path.join(root, "Variable")
     removeTree(variableFontsRoot)
 
-    for sourceDesignspace in generateOptions["sourceDesignspaces"]:
-        if isinstance(sourceDesignspace, str):
-            operator = BatchEditorOperator(sourceDesignspace)
-        else:
-            operator = sourceDesignspace
-            operator.doc = operator.doc.deepcopyExceptFonts()
-            # copy all sources
-            for key, font in list(operator.fonts.items()):
-                operator.fonts[key] = font.copy()
+    # formats with the same outlines share a single variable font build
+    outlineFormats = dict()
+    for binaryFormat, postProcessCallback in binaryFormats:
+        binaryExtention = binaryFormat.split("-")[0]
+        outlineFormats.setdefault(binaryExtention, []).append((binaryFormat, postProcessCallback))
+
+    # build into a private temp folder, only final binaries are written into the root
+    tempRoot = tempfile.mkdtemp(prefix="batchVariable_")
+    buildRoot = tempRoot
+    if settings["batchSettingExportDebug"]:
+        # keep the debug files next to the variable fonts
+        buildRoot = variableFontsRoot
+        buildTree(buildRoot)
+    try:
+        for sourceDesignspace in generateOptions["sourceDesignspaces"]:
+            operator = loadOperator(sourceDesignspace)
+
+            designspaceHash = None
+            if generateOptions.get("buildCache") is not None:
+                designspaceHash = hashSource(sourceDesignspace)
+
+            # loop over all interpolable operators based on the given variable fonts
+            for name, interpolableOperator in operator.getInterpolableUFOOperators(useVariableFonts=True):
+                sourcesHash = getSourcesHash(designspaceHash, interpolableOperator)
+
+                # all outline formats are built from the same sources
+                glyphCache = dict()
+                for binaryExtention, formats in outlineFormats.items():
+                    suffix = settings["variableFontsSuffix"]
+                    fileName = f"{name}{suffix}.{binaryExtention}"
+                    builtPath = os.path.join(buildRoot, f"temp_{fileName}")
+
+                    buildVariableFont(
+                        operator=operator,
+                        interpolableOperator=interpolableOperator,
+                        name=name,
+                        builtPath=builtPath,
+                        sourcesHash=sourcesHash,
+                        generateOptions=generateOptions,
+                        settings=settings,
+                        report=report,
+                        debug=settings["batchSettingExportDebug"],
+                        glyphCache=glyphCache
+                    )
 
-        # loop over all interpolable operators based on the given variable fonts
-        for name, interpolableOperator in operator.getInterpolableUFOOperators(useVariableFonts=True):
-            for binaryFormat, postProcessCallback in binaryFormats:
-                binaryExtention = binaryFormat.split("-")[0]
+                    if not os.path.exists(builtPath):
+                        # the build failed, see the report
+                        continue
+
+                    for binaryFormat, postProcessCallback in formats:
+                        if settings["batchSettingExportInSubFolders"]:
+                            fontDir = os.path.join(variableFontsRoot, binaryFormat)
+                        else:
+                            fontDir = variableFontsRoot
+                        buildTree(fontDir)
+
+                        # each format post processes its own copy of the build
+                        sourcePath = os.path.join(tempRoot, f"temp_{binaryFormat}_{fileName}")
+                        shutil.copyfile(builtPath, sourcePath)
+                        destinationPath = os.path.join(fontDir, fileName)
+
+                        # post process in memory and write the final binary once
+                        postProcessCallback(
+                            sourcePath,
+                            destinationPath
+                        )
+                    os.remove(builtPath)
+    finally:
+        removeTree(tempRoot)
+
+
+def loadOperator(sourceDesignspace):
+    """
+    Return an operator for a designspace path or an operator with copied sources,
+    building a variable font changes the sources.
+    """
+    if isinstance(sourceDesignspace, str):
+        return BatchEditorOperator(sourceDesignspace)
+    operator = sourceDesignspace
+    operator.doc = operator.doc.deepcopyExceptFonts()
+    # copy all sources
+    for key, font in list(operator.fonts.items()):
+        operator.fonts[key] = font.copy()
+    return operator
 
-                suffix = settings["variableFontsSuffix"]
-                fileName = f"{name}{suffix}.{binaryExtention}"
-                tempFileName = f"temp_{fileName}"
 
-                if settings["batchSettingExportInSubFolders"]:
-                    fontDir = os.path.join(variableFontsRoot, binaryFormat)
-                else:
-                    fontDir = variableFontsRoot
-
-                buildTree(fontDir)
-
-                GenerateVariableFont(
-                    operator=interpolableOperator,
-                    destinationPath=os.path.join(fontDir, tempFileName),
-                    designspace=operator.doc,
-                    discreteAxisName=name,
-                    autohint=settings["variableFontsAutohint"],
-                    fitToExtremes=settings["variableFontsInterpolateToFitAxesExtremes"],
-                    releaseMode=False,
-                    glyphOrder=None,
-                    report=report,
-                    debug=settings["batchSettingExportDebug"]
-                )
+def getSourcesHash(designspaceHash, interpolableOperator):
+    """
+    Return a hash of the designspace and all sources of an interpolable operator,
+    or None when a source has no content on disk.
+    """
+    if designspaceHash is None:
+        return None
+    sourceHashes = [hashSource(sourceDescriptor.path) for sourceDescriptor in interpolableOperator.sources]
+    if None in sourceHashes:
+        return None
+    return hashData(designspaceHash, sourceHashes)
+
+
+def buildVariableFont(operator, interpolableOperator, name, builtPath, sourcesHash, generateOptions, settings, report, debug=False, glyphCache=None):
+    """
+    Build a variable font at `builtPath` or restore it from the compile cache or the build cache.
+    """
+    binaryExtention = os.path.splitext(builtPath)[-1][1:].lower()
+    compileCache = generateOptions.get("compileCache")
+    buildCache = generateOptions.get("buildCache")
+    fileName = os.path.basename(builtPath)
+
+    compileKey = None
+    if compileCache is not None and operator.path is not None:
+        compileKey = compileCache.makeKey(f"{operator.path}#{name}", binaryExtention, False, False, settings["variableFontsAutohint"], False)
+    buildKey = None
+    if buildCache is not None:
+        buildKey = buildCache.makeKey(sourcesHash, "variable", name, binaryExtention)
+
+    if compileKey is not None and compileKey in compileCache:
+        compileCache.restore(compileKey, builtPath)
+        report.writeTitle(f"Generate {binaryExtention.upper()}", "'")
+        report.indent()
+        report.write(f"reused '{fileName}' built earlier in this batch")
+        report.dedent()
+        report.newLine()
+        return
+    if buildKey is not None and buildCache.get(buildKey, builtPath) is not None:
+        report.writeTitle(f"Generate {binaryExtention.upper()}", "'")
+        report.indent()
+        report.write(f"restored '{fileName}' from the build cache")
+        report.dedent()
+        report.newLine()
+    else:
+        GenerateVariableFont(
+            operator=interpolableOperator,
+            destinationPath=builtPath,
+            designspace=operator.doc,
+            discreteAxisName=name,
+            autohint=settings["variableFontsAutohint"],
+            fitToExtremes=settings["variableFontsInterpolateToFitAxesExtremes"],
+            releaseMode=False,
+            glyphOrder=None,
+            report=report,
+            debug=debug,
+            glyphCache=glyphCache,
+            fingerprintCache=generateOptions.get("fingerprintCache"),
+            quadraticCache=generateOptions.get("quadraticCache")
+        )
+        if buildKey is not None:
+            buildCache.set(buildKey, builtPath)
+    if compileKey is not None:
+        compileCache.store(compileKey, builtPath, "")
+
+
+def setInstanceNames(font, familyName, styleName, postScriptFontName=None, styleMapFamilyName=None, styleMapStyleName=None):
+    """
+    Set the family, style, full and PostScript names of a static instance
+    and the style linking bits in OS/2 fsSelection and head macStyle.
+    """
+    if not postScriptFontName:
+        postScriptFontName = f"{familyName}-{styleName}".replace(" ", "")
+    nameTable = font["name"]
+    # remove all names of the variable font
+    for nameID in (1, 2, 4, 6, 16, 17, 21, 22, 25):
+        nameTable.removeNames(nameID=nameID)
+    if styleMapStyleName:
+        # style map names of the instance, like "bold italic"
+        legacyFamilyName = styleMapFamilyName or familyName
+        legacyStyleName = styleMapStyleName.title()
+        nameTable.setName(legacyFamilyName, 1, 3, 1, 0x409)
+        nameTable.setName(legacyStyleName, 2, 3, 1, 0x409)
+        if (legacyFamilyName, legacyStyleName) != (familyName, styleName):
+            nameTable.setName(familyName, 16, 3, 1, 0x409)
+            nameTable.setName(styleName, 17, 3, 1, 0x409)
+    elif styleName in ("Regular", "Italic", "Bold", "Bold Italic"):
+        nameTable.setName(familyName, 1, 3, 1, 0x409)
+        nameTable.setName(styleName, 2, 3, 1, 0x409)
+    else:
+        # legacy family names group four styles at most
+        nameTable.setName(f"{familyName} {styleName}", 1, 3, 1, 0x409)
+        nameTable.setName("Regular", 2, 3, 1, 0x409)
+        nameTable.setName(familyName, 16, 3, 1, 0x409)
+        nameTable.setName(styleName, 17, 3, 1, 0x409)
+    nameTable.setName(f"{familyName} {styleName}", 4, 3, 1, 0x409)
+    nameTable.setName(postScriptFontName, 6, 3, 1, 0x409)
+    if "CFF " in font:
+        cff = font["CFF "].cff
+        cff.fontNames = [postScriptFontName]
+        topDict = cff.topDictIndex[0]
+        topDict.FullName = f"{familyName} {styleName}"
+        topDict.FamilyName = familyName
+    # the style bits of the default master must not leak into the instance
+    if "head" in font:
+        font["head"].macStyle = 0
+    if "OS/2" in font:
+        instancer.setRibbiBits(font)
+
+
+def instantiateStaticFont(data, location, path, familyName, styleName, postScriptFontName=None, styleMapFamilyName=None, styleMapStyleName=None):
+    """
+    Cut a static instance at a fully pinned user location out of variable font data,
+    with overlaps removed, and save it at `path`.
+    Return a short report string.
+    """
+    # each instance parses its own copy of the variable font data
+    font = TTFont(io.BytesIO(data))
+    # static otf instances are written with a CFF table
+    downgradeCFF2 = "CFF2" in font
+    result = "overlaps removed"
+    try:
+        instancer.instantiateVariableFont(font, location, inplace=True, overlap=instancer.OverlapMode.REMOVE, downgradeCFF2=downgradeCFF2)
+    except ImportError:
+        # removing overlaps requires skia-pathops
+        font = TTFont(io.BytesIO(data))
+        instancer.instantiateVariableFont(font, location, inplace=True, downgradeCFF2=downgradeCFF2)
+        result = "overlaps kept, skia-pathops is not available"
+    setInstanceNames(font, familyName, styleName, postScriptFontName, styleMapFamilyName, styleMapStyleName)
+    font.save(path)
+    font.close()
+    return result
+
+
+def buildStaticInstances(root, generateOptions, settings, progress, report, binaryExtentions):
+    """
+    Build all static instances of all designspaces by building each variable font once
+    and cutting the instances out of it with the fontTools instancer.
+    The instances are written in `root`.
+    Return a list of source binaries for `generateBinaryPaths`.
+    """
+    sourceBinaries = []
+    report.writeTitle("Batch Generated Static Instances from Variable Fonts:")
+    progress.setText("Generate Static Instances...")
+    report.indent()
+    for sourceDesignspace in generateOptions["sourceDesignspaces"]:
+        operator = loadOperator(sourceDesignspace)
+
+        designspaceHash = None
+        if generateOptions.get("buildCache") is not None:
+            designspaceHash = hashSource(sourceDesignspace)
 
-                sourcePath = os.path.join(fontDir, tempFileName)
-                destinationPath = os.path.join(fontDir, fileName)
-                sourcePath, destinationPath = postProcessCallback(
-                    sourcePath,
-                    destinationPath
+        for name, interpolableOperator in operator.getInterpolableUFOOperators(useVariableFonts=True):
+            instanceDescriptors = list(interpolableOperator.instances)
+            if not instanceDescriptors:
+                continue
+            axisTags = {axis.name: axis.tag for axis in interpolableOperator.doc.axes}
+            # the location of the instances in the variable font are fully pinned user locations
+            locations = [
+                {axisTags[axisName]: value for axisName, value in instanceDescriptor.getFullUserLocation(interpolableOperator.doc).items() if axisName in axisTags}
+                for instanceDescriptor in instanceDescriptors
+            ]
+            items = []
+            for index, instanceDescriptor in enumerate(instanceDescriptors):
+                items.append(dict(
+                    familyName=instanceDescriptor.familyName,
+                    styleName=instanceDescriptor.styleName,
+                    postScriptFontName=instanceDescriptor.postScriptFontName,
+                    styleMapFamilyName=instanceDescriptor.styleMapFamilyName,
+                    styleMapStyleName=instanceDescriptor.styleMapStyleName,
+                    source=f"{operator.path} {name}: {instanceDescriptor.name or instanceDescriptor.styleName}",
+                    paths=dict(),
+                    appliedSettings=set(),
+                    # names, style bits and the OS/2 weight, width and slant are set by the instancer
+                    # other font info is not interpolated, the instance inherits the variable font info
+                    skippedSettings=["Interpolated Font Info"]
+                ))
+            sourcesHash = getSourcesHash(designspaceHash, interpolableOperator)
+
+            glyphCache = dict()
+            for binaryExtention in binaryExtentions:
+                builtPath = os.path.join(root, f"temp_{len(sourceBinaries)}_{name}.{binaryExtention}")
+                buildVariableFont(
+                    operator=operator,
+                    interpolableOperator=interpolableOperator,
+                    name=name,
+                    builtPath=builtPath,
+                    sourcesHash=sourcesHash,
+                    generateOptions=generateOptions,
+                    settings=settings,
+                    report=report,
+                    glyphCache=glyphCache
                 )
-                if os.path.exists(sourcePath) and sourcePath != destinationPath:
-                    shutil.copyfile(sourcePath, destinationPath)
-                    os.remove(sourcePath)
+                if not os.path.exists(builtPath):
+                    # the build failed, see the report
+                    continue
+                with open(builtPath, "rb") as f:
+                    data = f.read()
+                os.remove(builtPath)
+
+                def instanceJob(index):
+                    item = items[index]
+                    path = os.path.join(root, f"instance_{len(sourceBinaries) + index}.{binaryExtention}")
+                    try:
+                        result = instantiateStaticFont(data, locations[index], path, item["familyName"], item["styleName"], item["postScriptFontName"], item["styleMapFamilyName"], item["styleMapStyleName"])
+                    except Exception as error:
+                        return None, f"Failed to instantiate: {error}", False
+                    return path, result, result == "overlaps removed"
+
+                report.writeTitle(f"Instantiate {binaryExtention.upper()}", "'")
+                report.indent()
+                # the instancer is pure python, one instance after another
+                for index, (item, location) in enumerate(zip(items, locations)):
+                    path, result, overlapsRemoved = instanceJob(index)
+                    report.write(f"{item['familyName']} {item['styleName']} {location}: {result}")
+                    if path is not None:
+                        item["paths"][binaryExtention] = path
+                    if overlapsRemoved:
+                        item["appliedSettings"].add("removeOverlap")
+                report.dedent()
+                report.newLine()
+            sourceBinaries.extend(items)
+    report.dedent()
+    return sourceBinaries
 
 
 # ===========
 # = helpers =
 # ===========
 
-class CompatibleContourPointPen(object):
+segmentTypeCodes = {
+    "move": 1,
+    "line": 2,
+    "curve": 3,
+    "qcurve": 4,
+}
+segmentTypeNames = {code: segmentType for segmentType, code in segmentTypeCodes.items()}
+curveSegmentTypeCodes = (segmentTypeCodes["curve"], segmentTypeCodes["qcurve"])
 
+
+def getGlyphFingerprint(glyph):
     """
-    Create a compatible glyphs
-    based on a given list of segmentTypes.
+    Return a structural fingerprint of a glyph:
+    the segment types of each contour and the component base glyphs.
+    Glyphs with the same fingerprint in all sources are compatible.
     """
+    contours = ["".join(segmentType[0] for segmentType in (point.segmentType for point in contour) if segmentType) for contour in glyph]
+    components = [component.baseGlyph for component in glyph.components]
+    return hashData(contours, components)
 
-    def __init__(self, types):
-        self.types = list(types)
-
-    def addPoint(self, pt, segmentType=None, *args, **kwargs):
-        self.contour.append((pt, segmentType, args, kwargs))
-
-    def beginPath(self):
-        self.contour = list()
-
-    def endPath(self):
-        # lets start
-        newContour = []
-        for i, ((x, y), segmentType, args, kwargs) in enumerate(self.contour):
-            if self.types:
-                # if there is segmentType
-                if segmentType is not None:
-                    # check with the given list of segmentTypes
-                    if segmentType != self.types[0]:
-                        # its different
-                        # get the previous point
-                        (px, py), _, _, _ = self.contour[i - 1]
-                        # calculate offcurve points
-                        # on 1/3 of the line segment length
-                        dx = x - px
-                        dy = y - py
-
-                        nx1 = px + dx * 0.333
-                        ny1 = py + dy * 0.333
-
-                        nx2 = px + dx * 0.666
-                        ny2 = py + dy * 0.666
-                        # add it to the new contour
-                        newContour.append(((nx1, ny1), None, [], {}))
-                        newContour.append(((nx2, ny2), None, [], {}))
-                        segmentType = self.types[0]
-                    # remove the first given segmentType
-                    self.types.pop(0)
-            # add the point
-            newContour.append(((x, y), segmentType, args, kwargs))
-        # set the contour
-        self.contour = newContour
-
-    def drawPoints(self, pointPen, roundCoordinates=1):
-        """
-        Draw into an other pointPen
-        """
-        pointPen.beginPath()
-        for (x, y), segmentType, args, kwargs in self.contour:
-            # identifiers are not needed here
-            # but the could cause errors, so remove them
-            kwargs["identifier"] = None
-            pointPen.addPoint((x, y), segmentType, *args, **kwargs)
-        pointPen.endPath()
+
+def getSegmentTypeCodes(contour):
+    """
+    Return the segment types of all on curve points as an array of codes.
+    """
+    return array("b", [segmentTypeCodes[point.segmentType] for point in contour if point.segmentType])
+
+
+def makeCompatiblePoints(contour, codes):
+    """
+    Return the points of a contour as (x, y, segmentType, smooth, name)
+    where the segment types follow the given codes.
+    A line segment becoming a curve gets off curves on 1/3 and 2/3 of the line.
+    """
+    points = [(point.x, point.y, point.segmentType, point.smooth, point.name) for point in contour]
+    newPoints = []
+    codeIndex = 0
+    codeCount = len(codes)
+    for i, (x, y, segmentType, smooth, name) in enumerate(points):
+        # if there is segmentType
+        if segmentType is not None and codeIndex < codeCount:
+            code = codes[codeIndex]
+            # check with the given segmentTypes
+            if segmentTypeCodes[segmentType] != code:
+                # its different
+                # get the previous point
+                px, py = points[i - 1][:2]
+                # calculate offcurve points
+                # on 1/3 of the line segment length
+                dx = x - px
+                dy = y - py
+                newPoints.append((px + dx * 0.333, py + dy * 0.333, None, False, None))
+                newPoints.append((px + dx * 0.666, py + dy * 0.666, None, False, None))
+                segmentType = segmentTypeNames[code]
+            codeIndex += 1
+        # add the point
+        newPoints.append((x, y, segmentType, smooth, name))
+    return newPoints
 
 
 class DecomposePointPen(TransformPointPen):
 
     """
     A simple transform point pen able to decompose components
-    in a given point pen.
+    in a given point pen, with the fully decomposed base glyphs from a component index.
     """
 
-    def __init__(self, glyphSet, outPen, transformation):
+    def __init__(self, componentIndex, outPen, transformation=(1, 0, 0, 1, 0, 0)):
         TransformPointPen.__init__(self, outPen, transformation)
-        self.glyphSet = glyphSet
+        self.componentIndex = componentIndex
 
     def beginPath(self, identifier=None):
         super().beginPath()
@@ -619,14 +1032,111 @@ class DecomposePointPen(TransformPointPen):
         super().addPoint(pt, segmentType=segmentType, smooth=smooth, name=name, **kwargs)
 
     def addComponent(self, glyphName, transformation, identifier=None):
-        try:
-            glyph = self.glyphSet[glyphName]
-        except KeyError:
-            pass
-        else:
-            transfromPointPen = TransformPointPen(self, transformation)
-            # ignore anchors
-            for contour in glyph:
-                contour.drawPoints(transfromPointPen)
-            for component in glyph.components:
-                component.drawPoints(transfromPointPen)
+        # ignore anchors
+        self.componentIndex.drawDecomposedGlyph(glyphName, TransformPointPen(self, transformation))
+
+
+class ComponentIndex:
+
+    """
+    A component dependency index of a font:
+    the base glyphs of each composite glyph, the users of each base glyph
+    and the nesting depth of each glyph.
+    Fully decomposed outlines are flattened once and reused.
+    Call `updateGlyph` or `removeGlyph` when components change.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._components = dict()
+        self._users = dict()
+        self._depths = dict()
+        self._decomposed = dict()
+        for glyph in font:
+            self._addGlyph(glyph)
+
+    def _addGlyph(self, glyph):
+        baseGlyphs = [component.baseGlyph for component in glyph.components]
+        if baseGlyphs:
+            self._components[glyph.name] = baseGlyphs
+            for baseGlyph in baseGlyphs:
+                self._users.setdefault(baseGlyph, set()).add(glyph.name)
+
+    def _invalidate(self, glyphName):
+        # the decomposed outline of all users changes as well
+        self._depths.clear()
+        todo = [glyphName]
+        seen = set()
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            self._decomposed.pop(name, None)
+            todo.extend(self._users.get(name, ()))
+
+    def removeGlyph(self, glyphName):
+        for baseGlyph in self._components.pop(glyphName, []):
+            users = self._users.get(baseGlyph)
+            if users:
+                users.discard(glyphName)
+        self._invalidate(glyphName)
+
+    def updateGlyph(self, glyph):
+        self.removeGlyph(glyph.name)
+        self._addGlyph(glyph)
+
+    def getUsers(self, glyphNames):
+        """
+        Return the sorted names of all glyphs using one of the given glyph names as component.
+        """
+        users = set()
+        for glyphName in glyphNames:
+            users.update(self._users.get(glyphName, ()))
+        return sorted(users)
+
+    def getDepth(self, glyphName, _visiting=None):
+        """
+        Return the nesting depth of components, 0 for a glyph without components.
+        """
+        if glyphName in self._depths:
+            return self._depths[glyphName]
+        if _visiting is None:
+            _visiting = set()
+        if glyphName in _visiting:
+            # recursive components
+            return 0
+        _visiting.add(glyphName)
+        depth = 0
+        baseGlyphs = self._components.get(glyphName)
+        if baseGlyphs:
+            depth = 1 + max(self.getDepth(baseGlyph, _visiting) for baseGlyph in baseGlyphs)
+        _visiting.discard(glyphName)
+        self._depths[glyphName] = depth
+        return depth
+
+    def getCompositeGlyphNames(self):
+        """
+        Return the names of all glyphs with components, the least nested first.
+        """
+        return sorted(self._components, key=lambda glyphName: (self.getDepth(glyphName), glyphName))
+
+    def drawDecomposedGlyph(self, glyphName, pointPen):
+        """
+        Draw the fully decomposed outline of a glyph into a point pen.
+        """
+        recording = self._decomposed.get(glyphName)
+        if recording is None:
+            # guard against recursive components
+            self._decomposed[glyphName] = []
+            recordingPen = RecordingPointPen()
+            if glyphName in self.font:
+                glyph = self.font[glyphName]
+                decomposePointPen = DecomposePointPen(self, recordingPen)
+                for contour in glyph:
+                    contour.drawPoints(decomposePointPen)
+                for component in glyph.components:
+                    component.drawPoints(decomposePointPen)
+            recording = self._decomposed[glyphName] = recordingPen.value
+        for methodName, args, kwargs in recording:
+            getattr(pointPen, methodName)(*args, **kwargs)
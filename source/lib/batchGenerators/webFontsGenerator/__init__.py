@@ -1,14 +1,15 @@
+import io
 import os
-import shutil
 import re
 
-from fontTools.ttLib import TTFont
-
 from mojo.compile import autohint as OTFAutohint
 
-from batchGenerators.batchTools import generatePaths, WOFF2Builder, removeTree, postProcessCollector, CSSWriter, HTMLWriter
+from batchGenerators.batchTools import generatePaths, generateBinaryPaths, WOFF2Builder, removeTree, postProcessCollector, CSSWriter, HTMLWriter, BinaryInfo, getMaxWorkers
+from batchGenerators.batchCache import hashFile
 
-from .autohint import TTFAutohint
+from .autohint import TTFAutohint, ttfautohint, defaultOptions
+from .unicodeRange import unicodeRangeBuilder
+from .subsetProfile import subsetProfileBuilder
 
 
 percentageRe = re.compile(r"%(?!\((familyName|styleName)\)s)")
@@ -25,25 +26,32 @@ cssFormatExtMap = {
 
 def htmlBuilder(htmlPreview, reportHTML, reportCSS):
 
-    def wrapper(sourcePath, destinationPath):
-        font = TTFont(sourcePath)
-        familyName = font["name"].getBestFamilyName()
-        styleName = font["name"].getBestSubFamilyName()
-        font.close()
-
-        _, ext = os.path.splitext(sourcePath)
+    def wrapper(sourcePath, destinationPath, binaryInfo=None):
+        if binaryInfo is None:
+            binaryInfo = BinaryInfo(sourcePath)
+        familyName = binaryInfo.familyName
+        styleName = binaryInfo.styleName
 
         cssFontName = f"{familyName}_{styleName}"
 
-        reportCSS.write("@font-face {")
-        reportCSS.indent()
-        reportCSS.write(f"font-family: '{cssFontName}';")
-        reportCSS.write(f"src:  url('{destinationPath}') format('{cssFormatExtMap[ext]}');")
-        reportCSS.write("font-weight: normal;")
-        reportCSS.write("font-style: normal;")
-        reportCSS.dedent()
-        reportCSS.write("}")
-        reportCSS.newLine()
+        # unicode range chunks replace the full binary in the css
+        fontFaces = [(item["path"], item["unicodeRange"]) for item in binaryInfo.files if item.get("unicodeRange")]
+        if not fontFaces:
+            fontFaces = [(destinationPath, None)]
+
+        for path, unicodeRange in fontFaces:
+            _, ext = os.path.splitext(path)
+            reportCSS.write("@font-face {")
+            reportCSS.indent()
+            reportCSS.write(f"font-family: '{cssFontName}';")
+            reportCSS.write(f"src:  url('{path}') format('{cssFormatExtMap[ext]}');")
+            reportCSS.write("font-weight: normal;")
+            reportCSS.write("font-style: normal;")
+            if unicodeRange:
+                reportCSS.write(f"unicode-range: {unicodeRange};")
+            reportCSS.dedent()
+            reportCSS.write("}")
+            reportCSS.newLine()
 
         reportHTML.write(f"<div style='font-family: \"{cssFontName}\", \"AdobeBlank\";'>")
         html = htmlPreview
@@ -55,24 +63,57 @@ def htmlBuilder(htmlPreview, reportHTML, reportCSS):
     return wrapper
 
 
-def autohintBuilder(autohintOptions, report):
-
-    def wrapper(sourcePath, destinationPath):
-        font = TTFont(sourcePath)
-        isTTF = "glyf" in font
-        font.close()
-        if isTTF:
-            result = TTFAutohint(sourcePath, destinationPath, autohintOptions)
+def autohintBuilder(autohintOptions, autohintCache=None):
+    # only the ttfautohint options and the ttfautohint binary change the result
+    cacheOptions = dict(defaultOptions)
+    cacheOptions.update({key: value for key, value in autohintOptions.items() if key in defaultOptions})
+    if autohintCache is not None:
+        cacheOptions["ttfautohint"] = hashFile(ttfautohint)
+
+    def wrapper(sourcePath, destinationPath, binaryInfo=None):
+        if binaryInfo is None:
+            binaryInfo = BinaryInfo(sourcePath)
+        cacheKey = None
+        # info added by ttfautohint to the name table is not cached
+        if autohintCache is not None and not (binaryInfo.isTTF and cacheOptions["ttfautohintAddTTFAutohintInfo"]):
+            font = binaryInfo.getFont()
+            cacheKey = autohintCache.makeKey(font, cacheOptions if binaryInfo.isTTF else dict())
+            if autohintCache.restore(cacheKey, font):
+                data = io.BytesIO()
+                font.save(data)
+                binaryInfo.setData(data.getvalue())
+                binaryInfo.report.write("restored autohinting from the autohint cache")
+                return
+        # the autohinters only work with files
+        path = binaryInfo.getPath()
+        if binaryInfo.isTTF:
+            hintedPath = f"{path}.autohint"
+            result = TTFAutohint(path, hintedPath, autohintOptions, glyphOrder=binaryInfo.glyphOrder)
+            isHinted = os.path.exists(hintedPath) and os.path.getsize(hintedPath) > 0
+            if isHinted:
+                binaryInfo.setPath(hintedPath)
         else:
-            result = OTFAutohint(sourcePath)
-            shutil.copyfile(sourcePath, destinationPath)
-        report.writeItems(result)
+            unhintedData = binaryInfo.getData()
+            # hints the binary in place
+            result = OTFAutohint(path)
+            binaryInfo.setPath(path)
+            isHinted = binaryInfo.getData() != unhintedData
+        binaryInfo.report.writeItems(result)
+        if cacheKey is not None:
+            # only store successfully hinted binaries
+            if isHinted:
+                autohintCache.set(cacheKey, binaryInfo.getPath())
+            else:
+                binaryInfo.report.write("autohinting failed, not stored in the autohint cache")
+
+    # autohinting runs in a subprocess, many fonts can be hinted at the same time
+    wrapper.runsInWorker = True
     return wrapper
 
 
 def build(root, generateOptions, settings, progress, report):
     if settings["webFontsAutohint"]:
-        autohintFunc = autohintBuilder(settings, report)
+        autohintFunc = autohintBuilder(settings, autohintCache=generateOptions.get("autohintCache"))
     else:
         autohintFunc = None
 
@@ -88,15 +129,26 @@ def build(root, generateOptions, settings, progress, report):
     else:
         htmlBuilderFunc = None
 
+    if settings["webFontsSubset"]:
+        subsetFunc = subsetProfileBuilder(settings, subsetCache=generateOptions.get("subsetCache"))
+    else:
+        subsetFunc = None
+
+    if settings["webFontsUnicodeRangeSplit"]:
+        # split woff2 fonts in chunks by unicode range, next to the full woff2 font
+        unicodeRangeFunc = unicodeRangeBuilder(settings["webFontsUnicodeRanges"])
+    else:
+        unicodeRangeFunc = None
+
     binaryFormats = []
     if generateOptions.get("webFontGenerate_OTF"):
-        binaryFormats.append(("otf", postProcessCollector(autohintFunc, htmlBuilderFunc)))
+        binaryFormats.append(("otf", postProcessCollector(subsetFunc, autohintFunc, htmlBuilderFunc)))
     if generateOptions.get("webFontGenerate_OTFWOFF2"):
-        binaryFormats.append(("otf-woff2", postProcessCollector(autohintFunc, WOFF2Builder, htmlBuilderFunc)))
+        binaryFormats.append(("otf-woff2", postProcessCollector(subsetFunc, autohintFunc, unicodeRangeFunc, WOFF2Builder, htmlBuilderFunc)))
     if generateOptions.get("webFontGenerate_TTF"):
-        binaryFormats.append(("ttf", postProcessCollector(autohintFunc, htmlBuilderFunc)))
+        binaryFormats.append(("ttf", postProcessCollector(subsetFunc, autohintFunc, htmlBuilderFunc)))
     if generateOptions.get("webFontGenerate_TTFWOFF2"):
-        binaryFormats.append(("ttf-woff2", postProcessCollector(autohintFunc, WOFF2Builder, htmlBuilderFunc)))
+        binaryFormats.append(("ttf-woff2", postProcessCollector(subsetFunc, autohintFunc, unicodeRangeFunc, WOFF2Builder, htmlBuilderFunc)))
     # if generateOptions["webFontGenerate_SVG"]:
     #    binaryFormats.append(("svg", None))
 
@@ -121,7 +173,28 @@ def build(root, generateOptions, settings, progress, report):
         exportInFolders=settings["batchSettingExportInSubFolders"],
         root=webFontsRoot,
         report=report,
-        progress=progress
+        progress=progress,
+        maxWorkers=getMaxWorkers(settings),
+        compileCache=generateOptions.get("compileCache"),
+        buildCache=generateOptions.get("buildCache"),
+        overlapCache=generateOptions.get("overlapCache"),
+        fontsInFlight=settings["batchSettingFontsInFlight"]
+    )
+
+    # static instances cut from a variable font and binary sources
+    generateBinaryPaths(
+        sourceBinaries=generateOptions.get("sourceBinaries"),
+        binaryFormats=binaryFormats,
+        keepFileNames=settings["batchSettingExportKeepFileNames"],
+        suffix=settings["webFontsSuffix"],
+        exportInFolders=settings["batchSettingExportInSubFolders"],
+        root=webFontsRoot,
+        report=report,
+        progress=progress,
+        decompose=settings["webFontsDecompose"],
+        removeOverlap=settings["webFontsRemoveOverlap"],
+        autohint=False,
+        releaseMode=settings["webFontsReleaseMode"]
     )
 
     if settings["webFontsGenerateHTML"]:
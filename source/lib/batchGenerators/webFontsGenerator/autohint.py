@@ -34,7 +34,7 @@ defaultOptions = {
 }
 
 
-def TTFAutohint(sourcePath, destinationPath, options=dict()):
+def TTFAutohint(sourcePath, destinationPath, options=dict(), glyphOrder=None):
     """
     Options:
           --debug                print debugging information
@@ -86,9 +86,11 @@ def TTFAutohint(sourcePath, destinationPath, options=dict()):
     preHinting = options["ttfautohintPreHinted"]
     symbolFont = options["ttfautohintSymbolFont"]
     if not symbolFont:
-        f = TTFont(sourcePath)
-        symbolFont = "o" not in f.getGlyphOrder()
-        f.close()
+        if glyphOrder is None:
+            f = TTFont(sourcePath)
+            glyphOrder = f.getGlyphOrder()
+            f.close()
+        symbolFont = "o" not in glyphOrder
 
     addTTFAutoHintInfo = options["ttfautohintAddTTFAutohintInfo"]
     overRideFontLicense = options["ttfautohintOverrideFontLicenseRestrictions"]
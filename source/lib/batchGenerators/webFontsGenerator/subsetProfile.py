@@ -0,0 +1,81 @@
+import io
+
+from fontTools import subset
+
+from batchGenerators.batchTools import BinaryInfo
+
+from .unicodeRange import parseUnicodeRangeItems
+
+
+def getSubsetProfile(settings):
+    """
+    Return a json compatible subset profile from the web font settings.
+    """
+    unicodes = set()
+    for start, end in parseUnicodeRangeItems(settings["webFontsSubsetUnicodes"]):
+        unicodes.update(range(start, end + 1))
+    layoutFeatures = [feature.strip() for feature in settings["webFontsSubsetLayoutFeatures"].split(",") if feature.strip()]
+    return dict(
+        unicodes=sorted(unicodes),
+        glyphNames=sorted(settings["webFontsSubsetGlyphNames"].split()),
+        layoutFeatures=layoutFeatures or ["*"],
+        stripNames=bool(settings["webFontsSubsetStripNames"]),
+        stripHinting=bool(settings["webFontsSubsetStripHinting"]),
+    )
+
+
+def subsetBinary(data, profile):
+    """
+    Subset a binary with a subset profile and return the subsetted binary.
+    Without unicodes and glyph names all characters in the font are kept.
+    """
+    options = subset.Options()
+    options.layout_features = profile["layoutFeatures"]
+    if not profile["stripNames"]:
+        options.name_IDs = ["*"]
+        options.name_languages = ["*"]
+        options.name_legacy = True
+    options.hinting = not profile["stripHinting"]
+    options.notdef_outline = True
+    options.glyph_names = True
+    options.recalc_bounds = True
+    font = subset.load_font(io.BytesIO(data), options)
+    unicodes = profile["unicodes"]
+    glyphNames = profile["glyphNames"]
+    if not unicodes and not glyphNames:
+        unicodes = list(font.getBestCmap() or dict())
+    subsetter = subset.Subsetter(options=options)
+    subsetter.populate(unicodes=unicodes, glyphs=[glyphName for glyphName in glyphNames if glyphName in font.getGlyphOrder()])
+    subsetter.subset(font)
+    output = io.BytesIO()
+    subset.save_font(font, output, options)
+    font.close()
+    return output.getvalue()
+
+
+def subsetProfileBuilder(settings, subsetCache=None):
+    profile = getSubsetProfile(settings)
+
+    def wrapper(sourcePath, destinationPath, binaryInfo=None):
+        if binaryInfo is None:
+            binaryInfo = BinaryInfo(sourcePath)
+        data = binaryInfo.getData()
+        glyphCount = len(binaryInfo.glyphOrder)
+        cacheKey = None
+        subsetData = None
+        if subsetCache is not None:
+            cacheKey = subsetCache.makeKey(data, profile)
+            subsetData = subsetCache.getData(cacheKey)
+        if subsetData is None:
+            subsetData = subsetBinary(data, profile)
+            if cacheKey is not None:
+                subsetCache.setData(cacheKey, subsetData)
+        else:
+            binaryInfo.report.write("restored subset from the subset cache")
+        # the glyph set changed
+        binaryInfo.setData(subsetData, keepFacts=False)
+        binaryInfo.report.write(f"subset: {glyphCount} glyphs, {len(data)} bytes > {len(binaryInfo.glyphOrder)} glyphs, {len(subsetData)} bytes")
+
+    # subsetting runs in pure python, but keeps the main thread free
+    wrapper.runsInWorker = True
+    return wrapper
@@ -0,0 +1,131 @@
+import io
+import os
+import re
+
+from fontTools import subset
+
+from batchGenerators.batchTools import BinaryInfo
+
+
+unicodeRangeRe = re.compile(r"^U\+([0-9A-F]{1,6})(?:-([0-9A-F]{1,6}))?$", re.IGNORECASE)
+
+
+def parseUnicodeRangeItems(text):
+    """
+    Parse a comma or white space separated list of unicodes and unicode ranges: `U+0000-00FF, U+0131`.
+    Return a list of (start, end).
+    """
+    unicodeRanges = []
+    for item in re.split(r"[,\s]+", text):
+        m = unicodeRangeRe.match(item)
+        if m is None:
+            continue
+        start = int(m.group(1), 16)
+        end = int(m.group(2) or m.group(1), 16)
+        unicodeRanges.append((min(start, end), max(start, end)))
+    return unicodeRanges
+
+
+def parseUnicodeRanges(text):
+    """
+    Parse unicode ranges, one chunk per line: `name: U+0000-00FF, U+0131, ...`.
+    Empty lines and lines starting with # are ignored.
+    Return a list of (name, [(start, end), ...]).
+    """
+    chunks = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or ":" not in line:
+            continue
+        name, ranges = line.split(":", 1)
+        name = re.sub(r"[^\w\-]", "", name.strip())
+        unicodeRanges = parseUnicodeRangeItems(ranges)
+        if name and unicodeRanges:
+            chunks.append((name, unicodeRanges))
+    return chunks
+
+
+def formatUnicodeRange(unicodeRanges):
+    """
+    Return the css `unicode-range` value for a list of (start, end).
+    """
+    items = []
+    for start, end in unicodeRanges:
+        if start == end:
+            items.append(f"U+{start:04X}")
+        else:
+            items.append(f"U+{start:04X}-{end:04X}")
+    return ", ".join(items)
+
+
+def groupUnicodeRanges(unicodes):
+    """
+    Return a sorted list of unicodes as a list of (start, end).
+    """
+    unicodeRanges = []
+    for unicode in sorted(unicodes):
+        if unicodeRanges and unicodeRanges[-1][1] == unicode - 1:
+            unicodeRanges[-1] = (unicodeRanges[-1][0], unicode)
+        else:
+            unicodeRanges.append((unicode, unicode))
+    return unicodeRanges
+
+
+def subsetChunk(data, unicodes):
+    """
+    Subset a binary to the given unicodes and return it woff2 compressed.
+    """
+    options = subset.Options()
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.notdef_outline = True
+    options.glyph_names = True
+    options.hinting = True
+    options.flavor = "woff2"
+    font = subset.load_font(io.BytesIO(data), options)
+    subsetter = subset.Subsetter(options=options)
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    subset.save_font(font, output, options)
+    font.close()
+    return output.getvalue()
+
+
+def unicodeRangeBuilder(unicodeRanges):
+    """
+    Split a binary into woff2 chunks by unicode range, written next to the binary.
+    Chunks without any glyph in the font are skipped.
+    Characters outside all unicode ranges are added to a final `remainder` chunk.
+    """
+    chunks = parseUnicodeRanges(unicodeRanges)
+
+    def wrapper(sourcePath, destinationPath, binaryInfo=None):
+        if binaryInfo is None:
+            binaryInfo = BinaryInfo(sourcePath)
+        fileName, ext = os.path.splitext(destinationPath)
+        data = binaryInfo.getData()
+        cmap = set(binaryInfo.getFont().getBestCmap() or dict())
+
+        jobs = []
+        remainingUnicodes = set(cmap)
+        for name, ranges in chunks:
+            unicodes = sorted(unicode for unicode in cmap if any(start <= unicode <= end for start, end in ranges))
+            if unicodes:
+                jobs.append((name, ranges, unicodes))
+            remainingUnicodes.difference_update(unicodes)
+        if remainingUnicodes:
+            # characters not in any range must not disappear from the web font
+            jobs.append(("remainder", groupUnicodeRanges(remainingUnicodes), sorted(remainingUnicodes)))
+
+        # one chunk after another, this already runs in a post process worker
+        for name, ranges, unicodes in jobs:
+            # each chunk is subsetted from its own copy of the binary
+            chunkData = subsetChunk(data, unicodes)
+            chunkPath = f"{fileName}_{ext[1:]}-{name}.woff2"
+            binaryInfo.addFile(chunkPath, chunkData, unicodeRange=formatUnicodeRange(ranges))
+            binaryInfo.report.write(f"unicode range {name}: {len(unicodes)} characters, {chunkPath}")
+
+    wrapper.runsInWorker = True
+    return wrapper
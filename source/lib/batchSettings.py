@@ -2,6 +2,9 @@ import ezui
 
 from mojo.extensions import getExtensionDefault, setExtensionDefault
 
+from batchGenerators.batchTools import removeTree
+from batchGenerators.batchCache import cacheRoot
+
 
 webFontsHtmlPreviewCSS = """.test {
     word-wrap: break-word;
@@ -41,12 +44,28 @@ webFontsHtmlPreview = """<div class="title">%(familyName)s %(styleName)s (%(file
 </div>
 """
 
+webFontsUnicodeRanges = """latin: U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, U+2000-206F, U+2074, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD
+latin-ext: U+0100-024F, U+0259, U+1E00-1EFF, U+2020, U+20A0-20AB, U+20AD-20CF, U+2113, U+2C60-2C7F, U+A720-A7FF
+cyrillic: U+0400-045F, U+0490-0491, U+04B0-04B1, U+2116
+cyrillic-ext: U+0460-052F, U+1C80-1C88, U+20B4, U+2DE0-2DFF, U+A640-A69F, U+FE2E-FE2F
+greek: U+0370-03FF
+greek-ext: U+1F00-1FFF
+"""
+
 
 defaultSettings = dict(
+    batchSettingAutohintCacheSize=256,
+    batchSettingBuildCache=0,
+    batchSettingBuildCacheSize=1024,
     batchSettingExportDebug=0,
     batchSettingExportInSubFolders=0,
     batchSettingExportKeepFileNames=0,
+    batchSettingFontsInFlight=0,
+    batchSettingInstancesFromVariableFont=0,
+    batchSettingMaxWorkers=0,
+    batchSettingParallel=0,
     batchSettingStoreReport=1,
+    batchSettingWriteInstanceUFOs=0,
 
     desktopFontsAutohint=0,
     desktopFontsDecompose=1,
@@ -80,7 +99,15 @@ defaultSettings = dict(
     webFontsHtmlPreviewCSS=webFontsHtmlPreviewCSS,
     webFontsReleaseMode=0,
     webFontsRemoveOverlap=0,
+    webFontsSubset=0,
+    webFontsSubsetGlyphNames="",
+    webFontsSubsetLayoutFeatures="*",
+    webFontsSubsetStripHinting=0,
+    webFontsSubsetStripNames=0,
+    webFontsSubsetUnicodes="",
     webFontsSuffix="",
+    webFontsUnicodeRanges=webFontsUnicodeRanges,
+    webFontsUnicodeRangeSplit=0,
 )
 
 # update settings when new keys are added
@@ -113,9 +140,22 @@ class BatchSettingsController(ezui.WindowController):
         > [ ] Autohint                                  @webFontsAutohint
         > [ ] Release Mode                              @webFontsReleaseMode
         > [ ] Generate HTML                             @webFontsGenerateHTML
+        > [ ] Split WOFF2 by Unicode Range              @webFontsUnicodeRangeSplit
         > : Suffix:
         > [_ _]                                         @webFontsSuffix
 
+        > !§ Subset
+
+        > [ ] Subset                                 @webFontsSubset
+        > : Unicodes:
+        > [_ _]                                      @webFontsSubsetUnicodes
+        > : Glyph Names:
+        > [_ _]                                      @webFontsSubsetGlyphNames
+        > : Layout Features:
+        > [_ _]                                      @webFontsSubsetLayoutFeatures
+        > [ ] Strip Names                            @webFontsSubsetStripNames
+        > [ ] Strip Hinting                          @webFontsSubsetStripHinting
+
         > !§ TTF Autohint
 
         > : Hint Set Range Minimum:
@@ -145,6 +185,10 @@ class BatchSettingsController(ezui.WindowController):
         > : CSS Style:
         > * CodeEditor                              @webFontsHtmlPreviewCSS
 
+        > !§ Unicode Ranges
+        > : Unicode Ranges:
+        > * CodeEditor                              @webFontsUnicodeRanges
+
 
         * Tab: Variable Fonts = ScrollingTwoColumnForm @variableFontsForm
         > : Generate:
@@ -163,6 +207,22 @@ class BatchSettingsController(ezui.WindowController):
         > ---
         > [ ] Store Export Report             @batchSettingStoreReport
         > ---
+        > [ ] Generate in Parallel            @batchSettingParallel
+        > : Workers (0 is all cores):
+        > [__]                                @batchSettingMaxWorkers
+        > : Fonts in Memory (0 is all):
+        > [__]                                @batchSettingFontsInFlight
+        > [ ] Instances from Variable Font    @batchSettingInstancesFromVariableFont
+        > [ ] Write Instance UFOs             @batchSettingWriteInstanceUFOs
+        > ---
+        > [ ] Use Build Cache                 @batchSettingBuildCache
+        > : Build Cache Size (MB):
+        > [__]                                @batchSettingBuildCacheSize
+        > : Autohint Cache Size (MB):
+        > [__]                                @batchSettingAutohintCacheSize
+        > :
+        > ( Clear Cache )                     @clearCache
+        > ---
         > [ ] Debug                           @batchSettingExportDebug
 
         =---=
@@ -198,6 +258,18 @@ class BatchSettingsController(ezui.WindowController):
             ttfautohintXHeightIncreaseLimit=dict(
                 valueType="integer",
             ),
+            batchSettingMaxWorkers=dict(
+                valueType="integer",
+            ),
+            batchSettingBuildCacheSize=dict(
+                valueType="integer",
+            ),
+            batchSettingAutohintCacheSize=dict(
+                valueType="integer",
+            ),
+            batchSettingFontsInFlight=dict(
+                valueType="integer",
+            ),
             cancel=dict(
                 width=85,
                 keyEquivalent=chr(27),
@@ -232,6 +304,9 @@ class BatchSettingsController(ezui.WindowController):
     def ttfautohintNoXHeightIncreaseLimitCallback(self, sender):
         self.ttfautohintXHeightIncreaseLimit.enable(not sender.get())
 
+    def clearCacheCallback(self, sender):
+        removeTree(cacheRoot)
+
     def cancelCallback(self, sender):
         self.w.close()
 